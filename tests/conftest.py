@@ -1,4 +1,8 @@
 import os
+import shutil
+import tempfile
+
+import pytest
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
@@ -37,3 +41,25 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True, scope='session')
+def temp_media_root():
+    # Загруженные в тестах картинки не должны попадать в MEDIA_ROOT проекта.
+    from django.test import override_settings
+
+    media_root = tempfile.mkdtemp()
+    with override_settings(MEDIA_ROOT=media_root, POST_THUMBNAIL_WORKERS=0):
+        yield media_root
+    shutil.rmtree(media_root, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def temp_cache_dir():
+    # Тесты не должны писать в общие кэши сайта. Каждый тест начинает
+    # с пустыми кэшами: его транзакция не коммитится, и сброс кэша по
+    # on_commit до следующего теста не доходит.
+    from core.testing import isolated_caches
+
+    with isolated_caches() as directory:
+        yield directory
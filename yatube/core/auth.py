@@ -0,0 +1,53 @@
+"""Пользователь запроса без обращения к базе.
+
+Django загружает пользователя из auth_user при каждом запросе.
+Здесь он берётся по id из сессии из общего для процессов кэша
+сессий ``SESSION_CACHE_ALIAS``, а запись сбрасывается сигналами при
+сохранении и удалении пользователя. Хеш сессии по-прежнему
+сверяется: после смены пароля чужие сессии завершаются.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+# Страховка на случай изменений в обход сигналов, например update().
+USER_CACHE_TIMEOUT = 60 * 60
+
+
+def user_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def user_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def get_user(request):
+    """То же, что ``django.contrib.auth.get_user``, но через кэш."""
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    key = user_key(user_id)
+    cache = user_cache()
+    user = cache.get(key)
+    if user is None:
+        user = auth.load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return AnonymousUser()
+        cache.set(key, user, USER_CACHE_TIMEOUT)
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash())):
+        request.session.flush()
+        return AnonymousUser()
+    return user
+
+
+def invalidate_user(sender, instance, **kwargs):
+    user_cache().delete(user_key(instance.pk))
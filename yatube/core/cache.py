@@ -0,0 +1,526 @@
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .instrumentation import count
+
+_missing = object()
+_local = threading.local()
+
+
+class InstrumentedCacheMixin:
+    """Считает попадания и промахи ``get`` и ``get_many`` в замерах запроса."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if getattr(_local, 'in_get_many', False):
+            # get_many многих бэкендов вызывает get: не считаем дважды.
+            return default if value is _missing else value
+        if value is _missing:
+            count('cache_misses')
+            return default
+        count('cache_hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        _local.in_get_many = True
+        try:
+            values = super().get_many(keys, version)
+        finally:
+            _local.in_get_many = False
+        count('cache_hits', len(values))
+        count('cache_misses', len(keys) - len(values))
+        return values
+
+    def clear(self):
+        super().clear()
+        # L1 этого процесса не должен пережить очистку своего L2.
+        clear_l1_caches()
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+# Время последнего чтения обновляется не чаще раза в секунду, иначе
+# каждое попадание превращалось бы в запись.
+ACCESS_RESOLUTION = 1.0
+# Переполнение проверяется раз в столько записей одного потока, поэтому
+# MAX_ENTRIES соблюдается приблизительно.
+CULL_INTERVAL = 64
+# Ограничение SQLite на число параметров запроса.
+MAX_PARAMS = 900
+BUSY_TIMEOUT = 5
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value, expires REAL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+def _encode(value):
+    # Целые числа хранятся как есть, чтобы incr не распаковывал pickle
+    # и чтобы их было видно в самой базе.
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(value):
+    return pickle.loads(value) if isinstance(value, bytes) else value
+
+
+class SQLiteCache(BaseCache):
+    """Общий для процессов одной машины кэш в файле SQLite.
+
+    ``LOCATION`` — путь к файлу. Записи вытесняются по давности
+    последнего чтения (LRU), когда их больше ``MAX_ENTRIES``; ``incr``
+    атомарен между процессами. Файл работает в режиме WAL: читатели
+    не ждут писателей.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Потерять кэш при сбое питания не страшно.
+            connection.execute('PRAGMA synchronous=OFF')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+        return self._local.connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _wrote(self):
+        self._local.writes += 1
+        if self._local.writes % CULL_INTERVAL == 1:
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', [time.time()]
+        )
+        (entries,) = connection.execute(
+            'SELECT count(*) FROM cache'
+        ).fetchone()
+        if entries <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            [entries // self._cull_frequency]
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._connection.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', [key]
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            return default
+        if accessed < now - ACCESS_RESOLUTION:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', [now, key]
+            )
+        return _decode(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found = {}
+        made = list(keys)
+        for start in range(0, len(made), MAX_PARAMS):
+            chunk = made[start:start + MAX_PARAMS]
+            rows = self._connection.execute(
+                'SELECT key, value FROM cache WHERE key IN ({}) '
+                'AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(chunk))
+                ),
+                chunk + [now]
+            )
+            for key, value in rows:
+                found[keys[key]] = _decode(value)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+            [self._key(key, version), _encode(value),
+             self.get_backend_timeout(timeout), time.time()]
+        )
+        self._wrote()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                [
+                    (self._key(key, version), _encode(value), expires, now)
+                    for key, value in data.items()
+                ]
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._wrote()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        # Одна инструкция: вставка удаётся, только если ключа нет
+        # или он просрочен.
+        cursor = self._connection.execute(
+            'INSERT INTO cache VALUES (?, ?, ?, ?) ON CONFLICT (key) '
+            'DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires, accessed = excluded.accessed '
+            'WHERE cache.expires <= ?',
+            [self._key(key, version), _encode(value),
+             self.get_backend_timeout(timeout), now, now]
+        )
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection
+        # Блокировка на запись берётся до чтения, поэтому параллельные
+        # incr из других процессов не теряют обновлений.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                [key, time.time()]
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = _decode(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                [_encode(value), key]
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()]
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [self._key(key, version), time.time()]
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self._connection.execute(
+            'DELETE FROM cache WHERE key = ?', [self._key(key, version)]
+        )
+
+    def delete_many(self, keys, version=None):
+        self._connection.executemany(
+            'DELETE FROM cache WHERE key = ?',
+            [(self._key(key, version),) for key in keys]
+        )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+
+class InstrumentedSQLiteCache(InstrumentedCacheMixin, SQLiteCache):
+    pass
+
+
+# Хранилища L1 по имени L2: общие для всех потоков процесса.
+_tiers = {}
+LOCK_POLL = 0.02
+
+
+def clear_l1_caches():
+    for l1, lock, _ in _tiers.values():
+        with lock:
+            l1.clear()
+
+
+class TieredCache(BaseCache):
+    """Небольшой кэш процесса (L1) перед общим кэшем (L2) с защитой от
+    одновременного пересчёта.
+
+    ``LOCATION`` — имя кэша L2 в ``CACHES``. L1 хранит не больше
+    ``MAX_ENTRIES`` записей не дольше ``L1_TIMEOUT`` секунд, поэтому
+    удаление в другом процессе доходит до этого за ``L1_TIMEOUT``.
+
+    Запись в L2 живёт на ``STALE_TIMEOUT`` дольше своего срока.
+    Просроченная запись отдаёт ``None`` только тому, кто взял блокировку
+    пересчёта, остальные до ``set`` получают устаревшее значение.
+    Пересчёт начинается раньше срока с вероятностью, растущей к его
+    концу и с временем пересчёта (XFetch, коэффициент ``BETA``).
+
+    Отсутствующий ключ тоже пересчитывает один: ключи страниц содержат
+    поколение ленты, и после каждого сброса все воркеры разом получают
+    промах. Остальные ждут его значения до ``LOCK_WAIT`` секунд, а не
+    дождавшись, считают сами.
+
+    Блокировку снимает ``set``, а если значение так и не записали
+    (``cache_page`` не кэширует приватные ответы) — ``close`` в конце
+    запроса. Вне запросов блокировка просроченной записи живёт вдвое
+    дольше измеренного пересчёта, но не больше ``LOCK_TIMEOUT`` секунд,
+    а отсутствующего ключа — ``COLD_LOCK_TIMEOUT`` секунд.
+
+    Очистка кэша L2 в этом процессе очищает и L1, см. ``clear_l1_caches``.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_name = location
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._stale_timeout = options.get('STALE_TIMEOUT', 60)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self._cold_lock_timeout = options.get('COLD_LOCK_TIMEOUT', 2)
+        self._lock_wait = options.get('LOCK_WAIT', 1)
+        self._beta = options.get('BETA', 1.0)
+        self._l1, self._l1_lock, self._stats = _tiers.setdefault(
+            location, (OrderedDict(), threading.Lock(), Counter())
+        )
+        # Когда этот поток взял блокировку ключа, когда она истечёт и
+        # чья она: по разнице со set оценивается время пересчёта.
+        self._filling = {}
+
+    @property
+    def _l2(self):
+        return caches[self._l2_name]
+
+    def stats(self):
+        """Счётчики процесса: попадания в L1 и L2, промахи, устаревшие
+        ответы, ранние пересчёты и ожидания чужого пересчёта."""
+        with self._l1_lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        with self._l1_lock:
+            self._stats[name] += 1
+
+    def _fresh(self, entry, now):
+        _, soft_expires, delta = entry
+        if soft_expires is None:
+            return True
+        # -log(u) — экспоненциальная случайная величина: пересчёт
+        # начинается тем раньше, чем дольше он идёт.
+        return now - delta * self._beta * math.log(
+            1 - random.random()
+        ) < soft_expires
+
+    def _l1_get(self, key, now):
+        with self._l1_lock:
+            item = self._l1.get(key)
+            if item is None:
+                return None
+            pickled, soft_expires, delta, l1_expires = item
+            if l1_expires <= now:
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+        return pickle.loads(pickled), soft_expires, delta
+
+    def _l1_set(self, key, entry, now):
+        # Значения хранятся сериализованными: ответ из кэша изменяется
+        # при отдаче и не должен быть общим для запросов.
+        value, soft_expires, delta = entry
+        item = (
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            soft_expires, delta, now + self._l1_timeout
+        )
+        with self._l1_lock:
+            self._l1[key] = item
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._l1_lock:
+            self._l1.pop(key, None)
+
+    def _lock_key(self, key):
+        return f'{key}:lock'
+
+    def _acquire(self, key, version, made_key, timeout):
+        if not self._l2.add(
+            self._lock_key(key), 1, timeout, version=version
+        ):
+            return False
+        now = time.perf_counter()
+        # Ключи, которые так и не записали, забываются вместе с
+        # блокировкой.
+        for filling_key, (_, expires, _, _) in list(self._filling.items()):
+            if expires <= now:
+                del self._filling[filling_key]
+        self._filling[made_key] = (now, now + timeout, key, version)
+        return True
+
+    def _wait(self, key, version, made_key):
+        deadline = time.perf_counter() + self._lock_wait
+        while time.perf_counter() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = self._l2.get(key, version=version)
+            if entry is not None:
+                self._l1_set(made_key, entry, time.time())
+                return entry
+            if self._acquire(
+                key, version, made_key, self._cold_lock_timeout
+            ):
+                # Пересчитывавший не записал значение: теперь наша очередь.
+                return None
+        return None
+
+    def _release(self, key, version):
+        self._filling.pop(self._l2.make_key(key, version=version), None)
+        self._l2.delete(self._lock_key(key), version=version)
+
+    def get(self, key, default=None, version=None):
+        made_key = self._l2.make_key(key, version=version)
+        now = time.time()
+        entry = self._l1_get(made_key, now)
+        if entry is not None and self._fresh(entry, now):
+            self._count('l1_hits')
+            count('cache_hits')
+            return entry[0]
+        entry = self._l2.get(key, version=version)
+        if entry is None:
+            if self._acquire(
+                key, version, made_key, self._cold_lock_timeout
+            ):
+                self._count('misses')
+                return default
+            self._count('stampedes')
+            count('cache_stampedes')
+            entry = self._wait(key, version, made_key)
+            return default if entry is None else entry[0]
+        self._l1_set(made_key, entry, now)
+        if self._fresh(entry, now):
+            self._count('hits')
+            return entry[0]
+        timeout = min(self._lock_timeout, max(1, math.ceil(2 * entry[2])))
+        if self._acquire(key, version, made_key, timeout):
+            self._count('early_recomputes' if now < entry[1] else 'misses')
+            return default
+        self._count('stale')
+        count('cache_stale')
+        return entry[0]
+
+    def _entry(self, value, timeout, started=None):
+        """Запись L2 и её срок в L2; ``None`` — запись уже просрочена."""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return (value, None, 0), None
+        if timeout <= 0:
+            return None, None
+        entry = (
+            value,
+            time.time() + timeout,
+            0 if started is None else time.perf_counter() - started,
+        )
+        return entry, timeout + self._stale_timeout
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made_key = self._l2.make_key(key, version=version)
+        started = self._filling.pop(made_key, (None,))[0]
+        entry, l2_timeout = self._entry(value, timeout, started)
+        if entry is None:
+            self.delete(key, version)
+        else:
+            self._l2.set(key, entry, l2_timeout, version=version)
+            self._l1_set(made_key, entry, time.time())
+        self._l2.delete(self._lock_key(key), version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        entry, l2_timeout = self._entry(value, timeout)
+        if entry is None:
+            return False
+        return self._l2.add(key, entry, l2_timeout, version=version)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        # В отличие от BaseCache, пишет через set, который снимает
+        # блокировку пересчёта, и снимает её, если записывать нечего.
+        value = self.get(key, version=version)
+        if value is None:
+            value = default() if callable(default) else default
+            if value is None:
+                self._release(key, version)
+            else:
+                self.set(key, value, timeout, version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self._l2.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self._l2.make_key(key, version=version))
+        self._l2.delete(key, version=version)
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        self._l2.clear()
+
+    def close(self, **kwargs):
+        # Django закрывает кэши в конце запроса. Блокировки значений,
+        # которые так и не записали (например, некэшируемых ответов),
+        # снимаются здесь, чтобы следующий запрос не ждал их истечения.
+        now = time.perf_counter()
+        for _, expires, key, version in self._filling.values():
+            if expires > now:
+                self._l2.delete(self._lock_key(key), version=version)
+        self._filling.clear()
@@ -0,0 +1,117 @@
+"""Замеры одного запроса: SQL, шаблоны, кэш и миниатюры.
+
+Счётчики текущего запроса лежат в ``Recorder`` в локальной памяти
+потока. Без запроса (команды, фоновые потоки) записи нет, и
+``timed`` с ``count`` ничего не делают. Стеки вызовов для поиска
+повторяющихся запросов собираются только в выбранных запросах.
+"""
+import os
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+_local = threading.local()
+# Кадры этих файлов не помогают понять, откуда пришёл запрос.
+SKIPPED_FILES = (__file__, os.path.join('core', 'middleware.py'))
+
+
+class Recorder:
+
+    def __init__(self, sampled=False):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.durations = Counter()
+        self.counts = Counter()
+        # (sql, место вызова) — только для выбранных запросов.
+        self.queries = []
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['sql'] += time.perf_counter() - started
+            self.counts['sql'] += 1
+            if self.sampled:
+                self.queries.append((sql, caller()))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def duplicates(self):
+        """Запросы, выполненные больше одного раза из одного места."""
+        return [
+            (sql, place, times)
+            for (sql, place), times in Counter(self.queries).most_common()
+            if times > 1
+        ]
+
+
+def caller():
+    """Ближайший к запросу кадр кода проекта: «файл:строка в функции»."""
+    for frame in reversed(traceback.extract_stack()):
+        if (frame.filename.startswith(settings.BASE_DIR)
+                and not frame.filename.endswith(SKIPPED_FILES)):
+            path = frame.filename[len(settings.BASE_DIR) + 1:]
+            return f'{path}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def recording(recorder):
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = None
+
+
+@contextmanager
+def timed(metric):
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.durations[metric] += time.perf_counter() - started
+
+
+def count(metric, amount=1):
+    recorder = current()
+    if recorder is not None:
+        recorder.counts[metric] += amount
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        # Вложенные шаблоны рендерятся внутри внешнего и не считаются
+        # отдельно.
+        with timed('templates'):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, который замеряет время рендеринга."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(
+            self.engine.from_string(template_code), self
+        )
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
@@ -0,0 +1,79 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post
+
+from .bench_site import percentile
+
+CACHED_AUTH = 'core.middleware.CachedAuthenticationMiddleware'
+# Сессии в базе и пользователь из auth_user, как было до core.auth.
+BEFORE = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'MIDDLEWARE': [
+        'django.contrib.auth.middleware.AuthenticationMiddleware'
+        if name == CACHED_AUTH else name
+        for name in settings.MIDDLEWARE
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов к базе и время ответа страниц для '
+        'авторизованного пользователя с сессиями в базе и с сессиями '
+        'и пользователем из кэша.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Сколько раз запрашивать каждую страницу.'
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author').order_by('-pk').first()
+        if post is None:
+            raise CommandError('В базе нет постов: запустите seed_bench.')
+        urls = {
+            'posts:index': reverse('posts:index'),
+            'posts:post_detail': reverse('posts:post_detail', args=[post.pk]),
+            'posts:follow_index': reverse('posts:follow_index'),
+            'posts:post_create': reverse('posts:post_create'),
+            'about:author': reverse('about:author'),
+        }
+        with override_settings(**BEFORE):
+            before = self.measure(post.author, urls, options['requests'])
+        after = self.measure(post.author, urls, options['requests'])
+        for name in urls:
+            self.stdout.write(
+                f'{name:<20} запросов {before[name][0]:5.1f} -> '
+                f'{after[name][0]:5.1f}, p50 {before[name][1]:6.2f} -> '
+                f'{after[name][1]:6.2f} мс'
+            )
+
+    def measure(self, user, urls, requests):
+        # Новый клиент загружает MIDDLEWARE и SESSION_ENGINE заново.
+        client = Client()
+        client.force_login(user)
+        results = {}
+        for name, url in urls.items():
+            client.get(url)
+            timings = []
+            query_counts = []
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    client.get(url)
+                    timings.append(time.perf_counter() - started)
+                query_counts.append(len(queries))
+            results[name] = (
+                sum(query_counts) / len(query_counts),
+                percentile(timings, 50) * 1000,
+            )
+        return results
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import (
+    Command as CreateCacheTable
+)
+from django.db import connection, connections
+
+from core.cache import SQLiteCache
+
+from .bench_site import percentile
+
+DB_CACHE_TABLE = 'bench_cache'
+BACKENDS = {
+    # Каждый процесс создаёт свой LocMemCache: так и работают воркеры.
+    'locmem': lambda location, params: LocMemCache('bench', params),
+    'db': lambda location, params: DatabaseCache(DB_CACHE_TABLE, params),
+    'sqlite': lambda location, params: SQLiteCache(location, params),
+}
+
+
+def run_worker(backend, location, operations, keys, payload_size, seed):
+    """Читает ключи по закону Ципфа, при промахе записывает значение.
+
+    Возвращает число попаданий и время каждого чтения.
+    """
+    cache = BACKENDS[backend](location, {
+        'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': keys * 2},
+    })
+    weights = list(accumulate(1 / (rank + 1) for rank in range(keys)))
+    chosen = random.Random(seed).choices(
+        range(keys), cum_weights=weights, k=operations
+    )
+    payload = os.urandom(payload_size)
+    hits = 0
+    timings = []
+    for number in chosen:
+        key = f'page:{number}'
+        started = time.perf_counter()
+        value = cache.get(key)
+        timings.append(time.perf_counter() - started)
+        if value is None:
+            cache.set(key, payload)
+        else:
+            hits += 1
+    connections.close_all()
+    return hits, timings
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает долю попаданий и задержку чтения LocMemCache, '
+        'DatabaseCache и общего SQLiteCache при разном числе процессов. '
+        'Общее число обращений делится между процессами, как запросы '
+        'между воркерами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 4, 16]
+        )
+        parser.add_argument(
+            '--operations', type=int, default=20000,
+            help='Сколько обращений к кэшу сделать за прогон.'
+        )
+        parser.add_argument(
+            '--keys', type=int, default=2000,
+            help='Сколько разных страниц запрашивается.'
+        )
+        parser.add_argument(
+            '--payload', type=int, default=20 * 1024,
+            help='Размер значения в байтах.'
+        )
+        parser.add_argument(
+            '--backends', nargs='+', choices=list(BACKENDS),
+            default=list(BACKENDS)
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        location = os.path.join(directory, 'cache.sqlite3')
+        if 'db' in options['backends']:
+            command = CreateCacheTable(stdout=self.stdout)
+            command.verbosity = 0
+            command.create_table(
+                connection.alias, DB_CACHE_TABLE, dry_run=False
+            )
+        self.stdout.write(
+            f'{"кэш":<8} {"процессов":>9} {"попаданий":>10} '
+            f'{"p50, мкс":>9} {"p95, мкс":>9} {"обращений/с":>12}'
+        )
+        try:
+            for backend in options['backends']:
+                for workers in options['workers']:
+                    self.clear(backend, location)
+                    self.run(backend, location, workers, options)
+        finally:
+            if 'db' in options['backends']:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'DROP TABLE ' + connection.ops.quote_name(
+                            DB_CACHE_TABLE
+                        )
+                    )
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def clear(self, backend, location):
+        if backend != 'locmem':
+            BACKENDS[backend](location, {}).clear()
+
+    def run(self, backend, location, workers, options):
+        operations = options['operations'] // workers
+        # Дочерние процессы не должны делить соединение родителя.
+        connections.close_all()
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('fork')
+        ) as executor:
+            results = list(executor.map(
+                run_worker,
+                [backend] * workers, [location] * workers,
+                [operations] * workers, [options['keys']] * workers,
+                [options['payload']] * workers, range(workers)
+            ))
+        elapsed = time.perf_counter() - started
+        hits = sum(worker_hits for worker_hits, _ in results)
+        timings = [
+            timing for _, worker_timings in results
+            for timing in worker_timings
+        ]
+        self.stdout.write(
+            f'{backend:<8} {workers:>9} {hits / len(timings):>10.1%} '
+            f'{percentile(timings, 50) * 1e6:>9.1f} '
+            f'{percentile(timings, 95) * 1e6:>9.1f} '
+            f'{len(timings) / elapsed:>12.0f}'
+        )
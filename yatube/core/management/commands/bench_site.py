@@ -0,0 +1,196 @@
+import json
+import math
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from posts.models import Post
+
+URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+# Выход разлогинил бы клиент посреди замера.
+SKIPPED = {'users:logout'}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def url_names():
+    for urlconf in URLCONFS:
+        module = import_module(urlconf)
+        for pattern in module.urlpatterns:
+            name = f'{module.app_name}:{pattern.name}'
+            if name not in SKIPPED:
+                yield name, list(pattern.pattern.converters)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет все страницы posts, users и about через тестовый клиент: '
+        'перцентили времени ответа, запросы к базе и пропускную '
+        'способность. Результат можно сохранить как базовый и сравнить '
+        'с ним следующий замер.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Сколько раз запрашивать каждую страницу.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Сколько запросов сделать до замера.'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.'
+        )
+        parser.add_argument(
+            '--user',
+            help='От чьего имени запрашивать страницы, по умолчанию — '
+                 'автор последнего поста.'
+        )
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help='Запрашивать страницы без входа.'
+        )
+        parser.add_argument('--output', help='Куда записать результат.')
+        parser.add_argument(
+            '--compare', metavar='BASELINE',
+            help='Сравнить результат с сохранённым ранее.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Рост p95 в процентах, который считается регрессией.'
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author').order_by('-pk').first()
+        if post is None:
+            raise CommandError('В базе нет постов: запустите seed_bench.')
+        user = post.author
+        if options['user']:
+            user = user.__class__.objects.get(username=options['user'])
+        client = Client(HTTP_HOST=self.host())
+        if not options['anonymous']:
+            client.force_login(user)
+        samples = self.samples(post, user)
+        results = {}
+        for name, arguments in url_names():
+            url = reverse(name, kwargs={
+                argument: samples[argument] for argument in arguments
+            })
+            results[name] = self.measure(client, url, options)
+            self.report(name, results[name])
+        baseline = {
+            'created': timezone.now().isoformat(),
+            'options': {
+                key: options[key]
+                for key in ('requests', 'warmup', 'cold', 'anonymous')
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(baseline, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as source:
+                previous = json.load(source)['results']
+            self.compare(previous, results, options['threshold'])
+
+    def host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+        return hosts[0].lstrip('.') if hosts else 'testserver'
+
+    def samples(self, post, user):
+        group_slug = Post.objects.exclude(group=None).order_by(
+            '-pk'
+        ).values_list('group__slug', flat=True).first()
+        return {
+            'post_id': post.pk,
+            'username': user.username,
+            'slug': group_slug or 'none',
+            'kind': 'posts',
+            'uidb64': urlsafe_base64_encode(force_bytes(user.pk)),
+            'token': default_token_generator.make_token(user),
+        }
+
+    def request(self, client, url, cold):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(queries)
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            self.request(client, url, options['cold'])
+        timings = []
+        query_counts = []
+        status = None
+        for _ in range(options['requests']):
+            status, elapsed, query_count = self.request(
+                client, url, options['cold']
+            )
+            timings.append(elapsed)
+            query_counts.append(query_count)
+        result = {'url': url, 'status': status}
+        for percent in PERCENTILES:
+            result[f'p{percent}_ms'] = round(
+                percentile(timings, percent) * 1000, 3
+            )
+        result['queries'] = sum(query_counts) / len(query_counts)
+        result['rps'] = round(len(timings) / sum(timings), 1)
+        return result
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<32} {result["status"]} '
+            f'p50 {result["p50_ms"]:7.2f} p95 {result["p95_ms"]:7.2f} '
+            f'p99 {result["p99_ms"]:7.2f} мс '
+            f'запросов {result["queries"]:5.1f} {result["rps"]:8.1f} req/s'
+        )
+
+    def compare(self, previous, results, threshold):
+        self.stdout.write(self.style.MIGRATE_HEADING('Сравнение'))
+        regressions = []
+        for name, result in results.items():
+            before = previous.get(name)
+            if before is None:
+                self.stdout.write(f'{name:<32} нет в базовом замере')
+                continue
+            change = (
+                (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                if before['p95_ms'] else 0
+            )
+            line = (
+                f'{name:<32} p95 {before["p95_ms"]:7.2f} -> '
+                f'{result["p95_ms"]:7.2f} мс ({change:+.0f}%), запросов '
+                f'{before["queries"]:.1f} -> {result["queries"]:.1f}'
+            )
+            if change > threshold or result['queries'] > before['queries']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError('Регрессии: ' + ', '.join(regressions))
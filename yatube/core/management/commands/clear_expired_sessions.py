@@ -0,0 +1,30 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет просроченные сессии порциями: в отличие от clearsessions '
+        'таблица не блокируется одним большим DELETE. Записи в кэше '
+        'истекают сами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        deleted = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[
+                :options['batch_size']
+            ])
+            if not keys:
+                break
+            # Каждая порция — отдельный короткий DELETE по ключам.
+            deleted += expired.filter(session_key__in=keys).delete()[0]
+        self.stdout.write(f'Удалено сессий: {deleted}')
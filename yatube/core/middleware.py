@@ -0,0 +1,83 @@
+import logging
+import random
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+
+from .auth import get_user
+from .instrumentation import Recorder, recording
+
+logger = logging.getLogger('yatube.slow_requests')
+
+# (метрика Server-Timing, длительность, счётчик для описания)
+SERVER_TIMINGS = (
+    ('sql', 'sql', 'sql'),
+    ('tpl', 'templates', None),
+    ('thumb', 'thumbnails', None),
+)
+
+
+class RequestTimingMiddleware:
+    """Замеряет запрос, отдаёт Server-Timing и пишет медленные запросы в лог.
+
+    Счётчики собираются всегда, а стеки повторяющихся запросов —
+    только в доле запросов ``REQUEST_TIMING_SAMPLE_RATE``: из них в лог
+    попадают те, что дольше ``REQUEST_TIMING_SLOW_MS``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        recorder = Recorder(sampled=bool(rate) and random.random() < rate)
+        with recording(recorder), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(recorder.execute)
+                )
+            response = self.get_response(request)
+        response['Server-Timing'] = server_timing(recorder)
+        if (recorder.sampled and recorder.elapsed * 1000
+                >= settings.REQUEST_TIMING_SLOW_MS):
+            log_slow_request(request, response, recorder)
+        return response
+
+
+def server_timing(recorder):
+    metrics = []
+    for name, duration, counter in SERVER_TIMINGS:
+        metric = f'{name};dur={recorder.durations[duration] * 1000:.1f}'
+        if counter is not None:
+            metric += f';desc="{recorder.counts[counter]}"'
+        metrics.append(metric)
+    metrics.append(
+        f'cache;desc="{recorder.counts["cache_hits"]} hit, '
+        f'{recorder.counts["cache_misses"]} miss, '
+        f'{recorder.counts["cache_stale"]} stale, '
+        f'{recorder.counts["cache_stampedes"]} wait"'
+    )
+    metrics.append(f'total;dur={recorder.elapsed * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def log_slow_request(request, response, recorder):
+    lines = [
+        f'{request.method} {request.get_full_path()} '
+        f'{response.status_code} {recorder.elapsed * 1000:.0f} ms; '
+        + server_timing(recorder)
+    ]
+    for sql, place, times in recorder.duplicates():
+        lines.append(f'  {times}x {place}: {sql}')
+    logger.warning('\n'.join(lines))
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """``AuthenticationMiddleware`` с пользователем из кэша, см. core.auth."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
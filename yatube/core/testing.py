@@ -0,0 +1,69 @@
+"""Окружение для прогона тестов."""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.utils.module_loading import import_string
+
+from .cache import SQLiteCache, clear_l1_caches
+
+
+@contextmanager
+def isolated_caches():
+    """Переносит файлы кэшей SQLite во временный каталог.
+
+    Иначе тесты писали бы в общие кэши работающего сайта, а записи
+    одного прогона доставались бы следующему.
+    """
+    directory = tempfile.mkdtemp()
+    caches = {}
+    for alias, params in settings.CACHES.items():
+        if issubclass(import_string(params['BACKEND']), SQLiteCache):
+            params = {
+                **params,
+                'LOCATION': os.path.join(directory, f'{alias}.sqlite3'),
+            }
+        caches[alias] = params
+    try:
+        with override_settings(CACHES=caches):
+            clear_l1_caches()
+            yield directory
+    finally:
+        clear_l1_caches()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def execute_on_commit():
+    """Выполняет колбэки ``on_commit``, отложенные внутри блока.
+
+    ``TestCase`` держит тест в транзакции, которая не коммитится, и
+    сами они не выполняются. В Django 3.2 для этого есть
+    ``TestCase.captureOnCommitCallbacks(execute=True)``.
+    """
+    start = len(connection.run_on_commit)
+    try:
+        yield
+    finally:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for _, callback in callbacks:
+            callback()
+
+
+class TestRunner(DiscoverRunner):
+    """``DiscoverRunner`` с кэшами во временном каталоге."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolated_caches = isolated_caches()
+        self._isolated_caches.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolated_caches.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
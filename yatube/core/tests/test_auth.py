@@ -0,0 +1,103 @@
+import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+User = get_user_model()
+
+
+class SessionCacheMixin:
+    # Кэши SQLite на время тестов переносятся во временный каталог,
+    # см. core.testing.isolated_caches.
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['sessions'].clear()
+        self.user = User.objects.create_user(
+            username='reader', password='old-password'
+        )
+        self.client.force_login(self.user)
+        self.url = reverse('about:author')
+
+
+class CachedAuthTest(SessionCacheMixin, TestCase):
+
+    def test_sessions_are_not_written_to_project(self):
+        location = caches['sessions']._path
+        self.assertTrue(location.startswith(tempfile.gettempdir()))
+        self.assertFalse(location.startswith(settings.BASE_DIR))
+
+    def test_session_and_user_are_read_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_saving_user_invalidates_cached_user(self):
+        self.client.get(self.url)
+        self.user.first_name = 'Новое имя'
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.wsgi_request.user.first_name, 'Новое имя')
+        self.user.set_password('new-password')
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_clear_expired_sessions_deletes_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(
+                session_key=f'expired{number}', session_data='',
+                expire_date=now - datetime.timedelta(days=1)
+            ) for number in range(3)
+        )
+        output = StringIO()
+        call_command(
+            'clear_expired_sessions', '--batch-size', '2', stdout=output
+        )
+        self.assertIn('Удалено сессий: 3', output.getvalue())
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class SharedSessionTest(SessionCacheMixin, TransactionTestCase):
+    # Кэши Django у каждого потока свои: второй поток со своим
+    # соединением к файлу кэша играет роль другого воркера.
+
+    def is_authenticated_elsewhere(self, cookies):
+        def request():
+            client = Client()
+            client.cookies = deepcopy(cookies)
+            try:
+                response = client.get(self.url)
+                return response.wsgi_request.user.is_authenticated
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(request).result()
+
+    def test_logout_ends_session_in_other_workers(self):
+        cookies = deepcopy(self.client.cookies)
+        self.client.get(self.url)
+        self.assertTrue(self.is_authenticated_elsewhere(cookies))
+        self.client.logout()
+        self.assertFalse(self.is_authenticated_elsewhere(cookies))
+
+    def test_password_change_ends_session_in_other_workers(self):
+        cookies = deepcopy(self.client.cookies)
+        self.assertTrue(self.is_authenticated_elsewhere(cookies))
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertFalse(self.is_authenticated_elsewhere(cookies))
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts.bench import Seeder
+from posts.models import AuthorStats, Comment, Post, User
+
+
+class BenchCommandsTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_comments_go_to_created_posts(self):
+        author = User.objects.create_user(username='auth')
+        old_posts = [
+            Post.objects.create(author=author, text='Старый пост')
+            for _ in range(3)
+        ]
+        old_posts[1].delete()
+        Seeder().seed(5, users=2, groups=0, comments=50)
+        new_ids = set(Post.objects.exclude(author=author).values_list(
+            'pk', flat=True
+        ))
+        self.assertEqual(len(new_ids), 5)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertLessEqual(
+            set(Comment.objects.values_list('post_id', flat=True)), new_ids
+        )
+
+    def test_seed_and_bench_every_page(self):
+        call_command(
+            'seed_bench', '--posts', '40', '--users', '5', '--groups', '3',
+            '--comments', '60', '--images', '0', '--batch-size', '15',
+            stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(Comment.objects.count(), 60)
+        self.assertEqual(
+            sum(AuthorStats.objects.values_list('posts_count', flat=True)),
+            40
+        )
+        baseline = os.path.join(self.directory, 'baseline.json')
+        call_command(
+            'bench_site', '--requests', '2', '--warmup', '0',
+            '--output', baseline, stdout=StringIO()
+        )
+        with open(baseline, encoding='utf-8') as source:
+            results = json.load(source)['results']
+        self.assertIn('posts:index', results)
+        self.assertIn('users:password_reset_confirm', results)
+        self.assertIn('about:tech', results)
+        self.assertNotIn('users:logout', results)
+        for result in results.values():
+            self.assertLess(result['status'], 500)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        output = StringIO()
+        call_command(
+            'bench_site', '--requests', '2', '--warmup', '0',
+            '--compare', baseline, '--threshold', '100000', stdout=output
+        )
+        self.assertIn('Сравнение', output.getvalue())
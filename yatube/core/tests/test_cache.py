@@ -0,0 +1,214 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.test import SimpleTestCase, override_settings
+
+from ..cache import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'TIMEOUT': None, 'OPTIONS': options}
+        )
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set('page', {'html': 'страница'})
+        self.cache.set_many({'first': 1, 'second': b'bytes'})
+        other = self.make_cache()
+        self.assertEqual(other.get('page'), {'html': 'страница'})
+        self.assertEqual(
+            other.get_many(['first', 'second', 'missing']),
+            {'first': 1, 'second': b'bytes'}
+        )
+        other.delete_many(['first', 'second'])
+        self.assertIsNone(self.cache.get('first', None))
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+
+    def test_add_incr_and_expiry(self):
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter', 10), 11)
+        self.assertEqual(self.make_cache().decr('counter'), 10)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 'value', timeout=0)
+        self.assertFalse(self.cache.has_key('expired'))
+        self.assertTrue(self.cache.add('expired', 'new'))
+        self.assertEqual(self.cache.get('expired'), 'new')
+        self.assertTrue(self.cache.touch('expired', None))
+
+    def test_least_recently_read_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        with mock.patch('core.cache.time.time') as now:
+            for number in range(5):
+                now.return_value = 1000 + number * 10
+                cache.set(f'key{number}', number)
+            now.return_value = 2000
+            # key0 прочитан недавно и должен пережить вытеснение.
+            cache.get('key0')
+            cache._cull()
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertFalse(cache.has_key('key1'))
+        self.assertFalse(cache.has_key('key2'))
+        self.assertEqual(cache.get('key4'), 4)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.InstrumentedLocMemCache',
+        'LOCATION': 'tiered-test',
+    },
+    'pages': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {'L1_TIMEOUT': 5, 'STALE_TIMEOUT': 60},
+    },
+})
+class TieredCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches['pages']
+        self.cache.clear()
+        # Счётчики общие для процесса.
+        self.cache._stats.clear()
+
+    def test_values_are_served_from_process_memory(self):
+        self.cache.set('page', 'страница')
+        caches['default'].delete('page')
+        self.assertEqual(self.cache.get('page'), 'страница')
+        self.assertEqual(self.cache.stats()['l1_hits'], 1)
+        caches['default'].clear()
+        self.assertIsNone(self.cache.get('page'))
+
+    def test_only_one_caller_recomputes_expired_value(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'новая'
+
+        self.cache.set('page', 'старая', timeout=10)
+        with mock.patch('time.time', return_value=time.time() + 11):
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(
+                    lambda _: caches['pages'].get_or_set('page', compute),
+                    range(8)
+                ))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), ['новая'] + ['старая'] * 7)
+        self.assertEqual(self.cache.stats()['stale'], 7)
+
+    def test_only_one_caller_computes_missing_value(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'страница'
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(
+                lambda _: caches['pages'].get_or_set('page', compute),
+                range(8)
+            ))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['страница'] * 8)
+        self.assertEqual(self.cache.stats()['stampedes'], 7)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'core.cache.InstrumentedLocMemCache',
+            'LOCATION': 'tiered-test',
+        },
+        'pages': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'default',
+            'OPTIONS': {'COLD_LOCK_TIMEOUT': 0.1, 'LOCK_WAIT': 1},
+        },
+    })
+    def test_waiter_computes_when_missing_value_is_not_stored(self):
+        cache = caches['pages']
+        # Ответ оказался некэшируемым: set не вызывается.
+        self.assertIsNone(cache.get('page'))
+        started = time.perf_counter()
+        self.assertIsNone(cache.get('page'))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(cache.stats()['stampedes'], 1)
+        self.assertTrue(caches['default'].has_key('page:lock'))
+
+    def test_locks_are_released_when_request_finishes(self):
+        self.assertIsNone(self.cache.get('page'))
+        self.assertTrue(caches['default'].has_key('page:lock'))
+        request_finished.send(sender=None)
+        self.assertFalse(caches['default'].has_key('page:lock'))
+        self.assertIsNone(self.cache.get('page'))
+        self.assertNotIn('stampedes', self.cache.stats())
+
+    def test_lock_expires_when_value_is_not_stored(self):
+        with mock.patch('time.time', return_value=1000):
+            self.cache.set('page', 'старая', timeout=10)
+        with mock.patch('time.time', return_value=1011):
+            # Ответ оказался некэшируемым: set не вызывается.
+            self.assertIsNone(self.cache.get('page'))
+            self.assertEqual(self.cache.get('page'), 'старая')
+        with mock.patch('time.time', return_value=1013):
+            self.assertIsNone(self.cache.get('page'))
+        self.assertEqual(len(self.cache._filling), 1)
+        self.cache.get_or_set('page', lambda: None)
+        self.assertFalse(caches['default'].has_key('page:lock'))
+        self.assertEqual(self.cache._filling, {})
+
+    def test_expired_value_is_served_while_recomputed(self):
+        with mock.patch('time.time', return_value=1000):
+            self.cache.set('page', 'старая', timeout=10)
+        with mock.patch('time.time', return_value=1011):
+            # Первый получает промах и пересчитывает, второй — старое.
+            self.assertIsNone(self.cache.get('page'))
+            self.assertEqual(self.cache.get('page'), 'старая')
+            self.cache.set('page', 'новая', timeout=10)
+            self.assertEqual(self.cache.get('page'), 'новая')
+        stats = self.cache.stats()
+        self.assertEqual(stats['stale'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'core.cache.InstrumentedLocMemCache',
+            'LOCATION': 'tiered-test',
+        },
+        'pages': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': 'default',
+            'OPTIONS': {'BETA': 10 ** 9},
+        },
+    })
+    def test_slow_values_are_recomputed_early(self):
+        cache = caches['pages']
+        with mock.patch('time.time', return_value=1000):
+            cache.set('page', 'старая', timeout=1)
+        with mock.patch('time.time', return_value=1002):
+            self.assertIsNone(cache.get('page'))
+            time.sleep(0.01)
+            cache.set('page', 'страница', timeout=60)
+            self.assertIsNone(cache.get('page'))
+            self.assertEqual(cache.get('page'), 'страница')
+        stats = cache.stats()
+        self.assertEqual(stats['early_recomputes'], 1)
+        self.assertEqual(stats['stale'], 1)
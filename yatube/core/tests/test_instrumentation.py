@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post
+
+from ..instrumentation import Recorder, current, recording
+
+User = get_user_model()
+
+
+class RequestTimingTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_counts_queries_and_cache(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', args=[self.post.pk])
+            )
+        timing = response['Server-Timing']
+        self.assertIn('sql;dur=', timing)
+        self.assertIn(f';desc="{len(queries)}"', timing)
+        self.assertRegex(timing, r'tpl;dur=\d+\.\d')
+        self.assertIn('total;dur=', timing)
+        self.client.get(reverse('posts:index'))
+        cached = self.client.get(reverse('posts:index'))
+        self.assertRegex(cached['Server-Timing'], r'cache;desc="[1-9]\d* hit')
+
+    @override_settings(
+        REQUEST_TIMING_SAMPLE_RATE=1.0, REQUEST_TIMING_SLOW_MS=0
+    )
+    def test_slow_request_log_includes_timings(self):
+        with self.assertLogs('yatube.slow_requests', 'WARNING') as logs:
+            self.client.get(
+                reverse('posts:post_detail', args=[self.post.pk])
+            )
+        self.assertIn(f'GET /posts/{self.post.pk}/ 200', logs.output[0])
+        self.assertIn('sql;dur=', logs.output[0])
+
+    def test_duplicate_queries_are_attributed_to_caller(self):
+        recorder = Recorder(sampled=True)
+        with recording(recorder), connection.execute_wrapper(
+            recorder.execute
+        ):
+            for _ in range(3):
+                Post.objects.filter(pk=self.post.pk).exists()
+            self.assertEqual(current(), recorder)
+        self.assertIsNone(current())
+        [(sql, place, times)] = recorder.duplicates()
+        self.assertEqual(times, 3)
+        self.assertIn('core/tests/test_instrumentation.py', place)
+        self.assertIn('test_duplicate_queries_are_attributed', place)
+
+    def test_unsampled_requests_are_not_logged(self):
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('yatube.slow_requests', 'WARNING'):
+                self.client.get(reverse('posts:index'))
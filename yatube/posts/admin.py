@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Group
+from .search import is_supported, match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not is_supported() or match_expression(search_term) is None:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        # Полнотекстовый индекс вместо LIKE '%...%' по всей таблице.
+        return queryset.filter(pk__in=matching_ids(search_term)), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,148 @@
+"""Лёгкий JSON API лент только для чтения.
+
+Сериализация сделана вручную: ленты отдают те же запросы ``for_feed``,
+что и HTML-страницы, а поля выбираются параметром ``?fields=``.
+"""
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+
+from .cache import (cache_feed, get_group_id, get_user_id, group_feed,
+                    index_feed, profile_feed)
+from .models import Post
+from .paginators import CursorPaginator
+from .thumbnails import cached_post_thumbnails
+
+POSTS_ON_PAGE = 10
+MAX_POSTS_ON_PAGE = 100
+
+
+def _author(post, request):
+    author = post.author
+    if author is None:
+        return None
+    return {
+        'username': author.username,
+        'full_name': author.get_full_name(),
+    }
+
+
+def _group(post, request):
+    group = post.group
+    if group is None:
+        return None
+    return {'slug': group.slug, 'title': group.title}
+
+
+def _image(post, request):
+    if not post.image:
+        return None
+    thumbnails = {}
+    # Пока миниатюры создаются, словарь пуст.
+    for (format_, width), thumbnail in sorted(
+        cached_post_thumbnails(post.image).items()
+    ):
+        thumbnails.setdefault(format_.lower(), {})[width] = (
+            request.build_absolute_uri(thumbnail.url)
+        )
+    return {
+        'url': request.build_absolute_uri(post.image.url),
+        'thumbnails': thumbnails,
+    }
+
+
+POST_FIELDS = {
+    'id': lambda post, request: post.pk,
+    'text': lambda post, request: post.text,
+    'pub_date': lambda post, request: post.pub_date.isoformat(),
+    'author': _author,
+    'group': _group,
+    'comments_count': lambda post, request: post.comments_count,
+    'image': _image,
+    'url': lambda post, request: request.build_absolute_uri(
+        reverse('posts:post_detail', kwargs={'post_id': post.pk})
+    ),
+}
+
+
+def error(message, status):
+    return JsonResponse(
+        {'detail': message}, status=status,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def requested_fields(request):
+    """Поля из ``?fields=``; ``None``, если среди них есть неизвестные."""
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(POST_FIELDS)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if not fields or any(field not in POST_FIELDS for field in fields):
+        return None
+    return fields
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def feed_response(request, post_list):
+    fields = requested_fields(request)
+    if fields is None:
+        return error(
+            'Неизвестное поле. Доступны: ' + ', '.join(POST_FIELDS), 400
+        )
+    try:
+        limit = int(request.GET.get('limit', POSTS_ON_PAGE))
+    except ValueError:
+        limit = POSTS_ON_PAGE
+    limit = min(max(limit, 1), MAX_POSTS_ON_PAGE)
+    page = CursorPaginator(post_list, limit).get_page(
+        request.GET.get('cursor')
+    )
+    serializers = [(field, POST_FIELDS[field]) for field in fields]
+    return JsonResponse(
+        {
+            'results': [
+                {field: serialize(post, request)
+                 for field, serialize in serializers}
+                for post in page
+            ],
+            'next': page_url(request, page.next_cursor),
+            'previous': page_url(request, page.previous_cursor),
+        },
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@require_safe
+@cache_feed(index_feed)
+def index(request):
+    return feed_response(request, Post.objects.for_feed())
+
+
+@require_safe
+@cache_feed(group_feed)
+def group_posts(request, slug):
+    group_id = get_group_id(slug)
+    if group_id is None:
+        return error('Группа не найдена.', 404)
+    return feed_response(
+        request, Post.objects.for_feed().filter(group_id=group_id)
+    )
+
+
+@require_safe
+@cache_feed(profile_feed)
+def profile(request, username):
+    user_id = get_user_id(username)
+    if user_id is None:
+        return error('Пользователь не найден.', 404)
+    return feed_response(
+        request, Post.objects.for_feed().filter(author_id=user_id)
+    )
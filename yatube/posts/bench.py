@@ -0,0 +1,192 @@
+"""Генерация больших наборов данных для замеров.
+
+Авторы и группы выбираются по закону Ципфа: немногие популярные
+авторы пишут большую часть постов. Комментарии достаются в основном
+свежим постам. Всё пишется через ``bulk_create``, поэтому после
+генерации счётчики пересчитываются, а кэш лент сбрасывается.
+"""
+import datetime
+import io
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from .cache import (SITE_FEED, bump_feed_generations, feeds_for,
+                    invalidate_feed_counts)
+from .counters import recount
+from .imports import preserved_dates
+from .models import Comment, Group, Post, User
+
+BATCH_SIZE = 5000
+TEXT_POOL_SIZE = 1000
+IMAGE_POOL_SIZE = 10
+ZIPF_EXPONENT = 1.1
+# Доля постов без группы.
+NO_GROUP_SHARE = 0.3
+
+
+def zipf_weights(count, exponent=ZIPF_EXPONENT):
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)
+    ))
+
+
+class Seeder:
+
+    def __init__(self, prefix=None, days=365, batch_size=BATCH_SIZE,
+                 log=None):
+        self.prefix = prefix or f'bench-{time.time_ns()}'
+        self.days = days
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.fake = Faker('ru_RU')
+        # Faker медленный: тексты генерируются один раз и повторяются.
+        self.texts = [
+            self.fake.paragraph(nb_sentences=random.randint(1, 8))
+            for _ in range(TEXT_POOL_SIZE)
+        ]
+
+    def users(self, count):
+        password = make_password(None)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{self.prefix}-{number}',
+                    first_name=self.fake.first_name(),
+                    last_name=self.fake.last_name(),
+                    password=password,
+                ) for number in range(count)
+            ),
+            batch_size=self.batch_size
+        )
+        return list(User.objects.filter(
+            username__startswith=f'{self.prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def groups(self, count):
+        Group.objects.bulk_create(
+            Group(
+                title=self.fake.catch_phrase()[:200],
+                slug=f'{self.prefix}-{number}',
+                description=self.fake.sentence(),
+            ) for number in range(count)
+        )
+        return list(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def images(self, count):
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for number in range(count):
+            image = Image.new('RGB', (1200, 800), tuple(
+                random.randrange(256) for _ in range(3)
+            ))
+            content = io.BytesIO()
+            image.save(content, 'JPEG', quality=85)
+            names.append(storage.save(
+                f'posts/{self.prefix}-{number}.jpg',
+                ContentFile(content.getvalue())
+            ))
+        return names
+
+    def posts(self, count, author_ids, group_ids, image_share, images):
+        author_weights = zipf_weights(len(author_ids))
+        group_weights = zipf_weights(len(group_ids)) if group_ids else None
+        now = timezone.now()
+        start = now - datetime.timedelta(days=self.days)
+        step = (now - start) / max(count, 1)
+        feeds = set()
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            authors = random.choices(
+                author_ids, cum_weights=author_weights, k=size
+            )
+            groups = (
+                random.choices(group_ids, cum_weights=group_weights, k=size)
+                if group_ids else [None] * size
+            )
+            posts = []
+            for number in range(size):
+                group_id = groups[number]
+                if random.random() < NO_GROUP_SHARE:
+                    group_id = None
+                # Даты растут вместе с id, как на живом сайте.
+                pub_date = start + step * (offset + number)
+                posts.append(Post(
+                    text=random.choice(self.texts),
+                    author_id=authors[number],
+                    group_id=group_id,
+                    image=(
+                        random.choice(images)
+                        if images and random.random() < image_share else ''
+                    ),
+                    pub_date=pub_date,
+                    updated=pub_date,
+                ))
+                feeds.update(feeds_for(authors[number], group_id))
+            with transaction.atomic():
+                Post.objects.bulk_create(posts)
+            self.log(f'Постов: {offset + size}/{count}')
+        return feeds
+
+    def comments(self, count, author_ids, post_ids):
+        """Комментирует посты ``post_ids``, упорядоченные от новых к старым.
+
+        Id постов могут идти с пропусками, поэтому Парето выбирает
+        место в списке, а не id.
+        """
+        if not post_ids or not count:
+            return
+        author_weights = zipf_weights(len(author_ids))
+        now = timezone.now()
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            authors = random.choices(
+                author_ids, cum_weights=author_weights, k=size
+            )
+            comments = [
+                Comment(
+                    # Распределение Парето: большая часть — свежим постам.
+                    post_id=post_ids[min(
+                        int(random.paretovariate(1.2)) - 1, len(post_ids) - 1
+                    )],
+                    author_id=authors[number],
+                    text=random.choice(self.texts),
+                    created=now - datetime.timedelta(
+                        minutes=random.randrange(60 * 24 * self.days)
+                    ),
+                ) for number in range(size)
+            ]
+            with transaction.atomic():
+                Comment.objects.bulk_create(comments)
+            self.log(f'Комментариев: {offset + size}/{count}')
+
+    def seed(self, posts, users=1000, groups=100, comments=0,
+             image_share=0.0):
+        author_ids = self.users(users)
+        group_ids = self.groups(groups)
+        images = self.images(IMAGE_POOL_SIZE) if image_share else []
+        last_id = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        with preserved_dates(Post):
+            feeds = self.posts(
+                posts, author_ids, group_ids, image_share, images
+            )
+        # bulk_create на SQLite не возвращает id: читаем созданные.
+        post_ids = list(Post.objects.filter(pk__gt=last_id).order_by(
+            '-pk'
+        ).values_list('pk', flat=True))
+        with preserved_dates(Comment):
+            self.comments(comments, author_ids, post_ids)
+        recount()
+        invalidate_feed_counts(feeds)
+        bump_feed_generations(feeds | {SITE_FEED})
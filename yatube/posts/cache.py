@@ -0,0 +1,224 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                quote_etag)
+from django.views.decorators.cache import cache_page
+
+from .models import Group, Post, User
+
+FEED_COUNT_TIMEOUT = 60 * 60
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Кэш страниц лент, см. CACHES.
+PAGE_CACHE = 'pages'
+# Поколение, общее для всех лент: меняется вместе с группами и авторами,
+# данные которых выводятся в карточках любой ленты.
+SITE_FEED = 'site'
+# Состав популярной ленты меняется только при пересчёте рейтинга, но
+# её карточки устаревают вместе с любым постом.
+POPULAR_FEED = 'popular'
+
+
+def feeds_for(author_id, group_id):
+    """Ленты, в которые попадает пост с такими автором и группой."""
+    feeds = ['index', POPULAR_FEED]
+    if author_id is not None:
+        feeds.append(f'profile:{author_id}')
+    if group_id is not None:
+        feeds.append(f'group:{group_id}')
+    return feeds
+
+
+def post_feeds(post):
+    # Значения берутся из __dict__, чтобы не подгружать отложенные поля.
+    return feeds_for(
+        post.__dict__.get('author_id'), post.__dict__.get('group_id')
+    )
+
+
+def count_key(feed):
+    return f'feed_count:{feed}'
+
+
+def invalidate_feed_counts(feeds):
+    """Сбрасывает счётчики лент после коммита текущей транзакции."""
+    keys = [count_key(feed) for feed in feeds]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def generation_key(feed):
+    return f'feed_generation:{feed}'
+
+
+def new_generation():
+    # Начинаем с текущего времени, а не с единицы: после вытеснения
+    # ключа поколения старые страницы не должны снова стать актуальными.
+    return time.time_ns()
+
+
+def feed_generations(feeds):
+    keys = [generation_key(feed) for feed in feeds]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_feed_generations(feeds):
+    """Меняет поколения лент после коммита текущей транзакции.
+
+    Иначе параллельный запрос мог бы прочитать новое поколение вместе
+    со старыми строками и закэшировать под ним устаревшую страницу,
+    которую больше никто не сбросит. Вне транзакции поколения меняются
+    сразу.
+    """
+    feeds = list(feeds)
+    transaction.on_commit(lambda: _bump_generations(feeds))
+
+
+def _bump_generations(feeds):
+    for feed in feeds:
+        key = generation_key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+
+
+def _object_id(model, key, **lookup):
+    object_id = cache.get(key)
+    if object_id is None:
+        object_id = model.objects.filter(**lookup).values_list(
+            'pk', flat=True
+        ).first()
+        if object_id is not None:
+            cache.set(key, object_id, FEED_CACHE_TIMEOUT)
+    return object_id
+
+
+def group_id_key(slug):
+    return f'group_id:{slug}'
+
+
+def user_id_key(username):
+    return f'user_id:{username}'
+
+
+def forget_object_ids(keys):
+    """Сбрасывает id по slug или имени после коммита транзакции."""
+    keys = list(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def index_feed():
+    return 'index'
+
+
+def popular_feed():
+    return POPULAR_FEED
+
+
+def get_group_id(slug):
+    return _object_id(Group, group_id_key(slug), slug=slug)
+
+
+def get_user_id(username):
+    return _object_id(User, user_id_key(username), username=username)
+
+
+def group_feed(slug):
+    group_id = get_group_id(slug)
+    return None if group_id is None else f'group:{group_id}'
+
+
+def profile_feed(username):
+    user_id = get_user_id(username)
+    return None if user_id is None else f'profile:{user_id}'
+
+
+def visitor(request):
+    if request.user.is_authenticated:
+        return f'user{request.user.pk}'
+    return 'anonymous'
+
+
+def make_etag(*parts):
+    return quote_etag(
+        hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    )
+
+
+def revalidate(response):
+    # Браузер хранит копию, но перед показом сверяет её по ETag.
+    if 'Expires' in response:
+        del response['Expires']
+    patch_cache_control(response, no_cache=True, max_age=0)
+    return response
+
+
+def cache_feed(feed_for):
+    """Кэширует страницы ленты до следующего изменения её постов.
+
+    ``feed_for`` получает именованные аргументы представления и
+    возвращает имя ленты (``None`` — не кэшировать). Поколение ленты
+    и пользователь входят в префикс ключа, поэтому устаревшие страницы
+    просто перестают запрашиваться, а гости и авторизованные
+    пользователи не получают чужие страницы.
+
+    Из того же префикса строится ETag, так что на повторный запрос
+    неизменившейся страницы отвечаем 304 ещё до поиска в кэше.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            feed = feed_for(**kwargs)
+            if feed is None:
+                return view(request, *args, **kwargs)
+            generation, site_generation = feed_generations([feed, SITE_FEED])
+            key_prefix = (
+                f'feed:{feed}:{generation}:{site_generation}:'
+                f'{visitor(request)}'
+            )
+            etag = make_etag(key_prefix, request.get_full_path())
+            response = None
+            if request.method in ('GET', 'HEAD'):
+                response = get_conditional_response(request, etag=etag)
+            if response is None:
+                cached_view = cache_page(
+                    FEED_CACHE_TIMEOUT, cache=PAGE_CACHE,
+                    key_prefix=key_prefix
+                )(view)
+                response = cached_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+            return revalidate(response)
+        return wrapper
+    return decorator
+
+
+def post_etag(request, post_id):
+    """ETag страницы поста без её отрисовки.
+
+    ``Post.updated`` меняется при правке поста, его комментариев,
+    автора и группы; число постов автора выводится отдельно.
+    Авторизованным выводится форма с CSRF-токеном, поэтому в ETag
+    входит и кука токена. Last-Modified не отдаётся: по одной дате
+    правки поста нельзя судить о числе постов автора и шапке страницы.
+    """
+    state = Post.objects.filter(pk=post_id).values_list(
+        'updated', 'author__stats__posts_count'
+    ).first()
+    if state is None:
+        return None
+    csrf = ''
+    if request.user.is_authenticated:
+        csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return make_etag(
+        *state, visitor(request), csrf, request.get_full_path()
+    )
@@ -0,0 +1,97 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_posts_count(author_id, group_id, delta):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+    if author_id is None:
+        return
+    stats = AuthorStats.objects.filter(author_id=author_id)
+    if not _change(stats, 'posts_count', delta) and not stats.exists():
+        # Строки ещё нет: считаем по уже изменённой таблице постов.
+        AuthorStats.objects.get_or_create(
+            author_id=author_id,
+            defaults={
+                'posts_count': Post.objects.filter(
+                    author_id=author_id
+                ).count()
+            }
+        )
+
+
+def change_followers_count(author_id, delta):
+    """Меняет число подписчиков автора и возвращает новое значение."""
+    stats = AuthorStats.objects.filter(author_id=author_id)
+    # Отписки при удалении автора не должны заново создавать его строку.
+    if not _change(stats, 'followers_count', delta) and delta > 0:
+        AuthorStats.objects.get_or_create(
+            author_id=author_id,
+            defaults={
+                'followers_count': Follow.objects.filter(
+                    author_id=author_id
+                ).count()
+            }
+        )
+    return stats.values_list('followers_count', flat=True).first()
+
+
+def change_comments_count(post_id, delta):
+    # Количество комментариев выводится в карточке поста.
+    post = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        post = post.filter(comments_count__gte=-delta)
+    post.update(
+        comments_count=F('comments_count') + delta,
+        updated=timezone.now()
+    )
+
+
+def _actual_count(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    counts = counts.values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+COUNTERS = (
+    (Group, 'posts_count', Post, 'group'),
+    (Post, 'comments_count', Comment, 'post'),
+    (AuthorStats, 'posts_count', Post, 'author'),
+    (AuthorStats, 'followers_count', Follow, 'author'),
+)
+
+
+def recount():
+    """Пересчитывает все счётчики, возвращает число исправленных строк.
+
+    Каждый счётчик исправляется одним UPDATE по расхождениям с
+    фактическим количеством.
+    """
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    )
+    AuthorStats.objects.bulk_create(
+        AuthorStats(author_id=author_id) for author_id in missing
+    )
+    fixed = {}
+    for model, field, counted_model, counted_field in COUNTERS:
+        actual = _actual_count(counted_model, counted_field)
+        drift = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).values_list('pk', flat=True)
+        changes = {field: actual}
+        if model is Post:
+            changes['updated'] = timezone.now()
+        fixed[f'{model.__name__}.{field}'] = model.objects.filter(
+            pk__in=drift
+        ).update(**changes)
+    return fixed
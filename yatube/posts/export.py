@@ -0,0 +1,130 @@
+"""Потоковая выгрузка постов и комментариев в NDJSON и CSV.
+
+Строки читаются порциями по первичному ключу, поэтому память не
+зависит от объёма выгрузки, а id последней выгруженной строки служит
+токеном для продолжения прерванной выгрузки.
+"""
+import csv
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000
+
+
+class Export:
+
+    def __init__(self, model, date_field, columns, group, author):
+        self.model = model
+        self.date_field = date_field
+        # (имя столбца, путь поля для values_list)
+        self.columns = columns
+        self.group = group
+        self.author = author
+
+    @property
+    def names(self):
+        return [name for name, _ in self.columns]
+
+
+EXPORTS = {
+    'posts': Export(
+        Post, 'pub_date',
+        (
+            ('id', 'id'),
+            ('pub_date', 'pub_date'),
+            ('author', 'author__username'),
+            ('group', 'group__slug'),
+            ('text', 'text'),
+            ('image', 'image'),
+            ('comments_count', 'comments_count'),
+        ),
+        group='group__slug', author='author__username',
+    ),
+    'comments': Export(
+        Comment, 'created',
+        (
+            ('id', 'id'),
+            ('created', 'created'),
+            ('post', 'post_id'),
+            ('author', 'author__username'),
+            ('text', 'text'),
+        ),
+        group='post__group__slug', author='author__username',
+    ),
+}
+
+
+def _start_of(day):
+    return timezone.make_aware(
+        datetime.datetime.combine(day, datetime.time.min)
+    )
+
+
+def export_rows(kind, since=None, until=None, group=None, author=None,
+                after=0, chunk_size=CHUNK_SIZE):
+    """Кортежи значений столбцов ``EXPORTS[kind]`` в порядке id.
+
+    ``since`` и ``until`` — даты включительно, ``after`` — id, после
+    которого продолжить.
+    """
+    export = EXPORTS[kind]
+    queryset = export.model.objects.all()
+    if since is not None:
+        queryset = queryset.filter(
+            **{f'{export.date_field}__gte': _start_of(since)}
+        )
+    if until is not None:
+        queryset = queryset.filter(**{
+            f'{export.date_field}__lt':
+                _start_of(until + datetime.timedelta(days=1))
+        })
+    if group is not None:
+        queryset = queryset.filter(**{export.group: group})
+    if author is not None:
+        queryset = queryset.filter(**{export.author: author})
+    queryset = queryset.order_by('pk').values_list(
+        *(path for _, path in export.columns)
+    )
+    last_id = after
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_id)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def ndjson_lines(names, rows, header=True):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+class _Line:
+    """Файл для csv.writer, который просто возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(names, rows, header=True):
+    """Строки CSV; при продолжении выгрузки заголовок не повторяется."""
+    writer = csv.writer(_Line())
+    if header:
+        yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(
+            value.isoformat() if isinstance(value, datetime.datetime)
+            else value
+            for value in row
+        )
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
@@ -1,11 +1,15 @@
-from django.forms import ModelForm, forms
+from django import forms
+from django.forms import ModelForm
 from .models import Post, Comment
+from .export import FORMATS
+from .uploads import BoundedImageField
 
 
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': BoundedImageField}
 
         def clean_subject(self):
             data = self.cleaned_data['text']
@@ -24,3 +28,14 @@ class CommentForm(ModelForm):
             if '' in data:
                 raise forms.ValidationError('Поле должно быть заполнено')
             return data
+
+
+class ExportForm(forms.Form):
+    since = forms.DateField(required=False)
+    until = forms.DateField(required=False)
+    group = forms.CharField(required=False)
+    author = forms.CharField(required=False)
+    after = forms.IntegerField(required=False, min_value=0)
+    format = forms.ChoiceField(
+        required=False, choices=[(name, name) for name in FORMATS]
+    )
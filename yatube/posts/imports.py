@@ -0,0 +1,257 @@
+"""Массовый импорт постов и комментариев из NDJSON и CSV.
+
+Формат строк совпадает с выгрузкой ``posts.export``. Записи читаются
+потоком и пишутся через ``bulk_create`` пачками, каждая пачка — в своей
+транзакции. Сигналы при этом не срабатывают, поэтому после импорта
+нужно пересчитать счётчики, пересобрать ленты подписок и сбросить кэш
+лент (это делает команда ``import_posts``).
+"""
+import csv
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import feeds_for
+from .models import Comment, Group, Post, User
+
+BATCH_SIZE = 1000
+
+
+def read_records(path, format_=None):
+    """Словари записей файла; формат по умолчанию — по расширению.
+
+    Строка NDJSON, которую не удалось разобрать, даёт ``None``: её
+    отклонит ``_reject_reason``, а не весь импорт.
+    """
+    format_ = format_ or ('csv' if path.endswith('.csv') else 'ndjson')
+    with open(path, encoding='utf-8', newline='') as source:
+        if format_ == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+@contextmanager
+def preserved_dates(model):
+    """Отключает auto_now и auto_now_add, чтобы сохранить даты из файла.
+
+    Меняет поля модели для всего процесса, поэтому годится только
+    для команд, а не для обработки запросов.
+    """
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+class Lookup:
+    """id авторов и групп по имени с созданием недостающих.
+
+    Найденные id остаются в памяти на весь импорт, а недостающие
+    имена одной пачки ищутся и создаются одним запросом.
+    """
+
+    def __init__(self):
+        self.ids = {User: {}, Group: {}}
+
+    def _resolve(self, model, field, names, build):
+        known = self.ids[model]
+        missing = {name for name in names if name and name not in known}
+        if missing:
+            known.update(model.objects.filter(
+                **{f'{field}__in': missing}
+            ).values_list(field, 'pk'))
+            absent = missing - set(known)
+            if absent:
+                model.objects.bulk_create(build(name) for name in absent)
+                known.update(model.objects.filter(
+                    **{f'{field}__in': absent}
+                ).values_list(field, 'pk'))
+        return {name: known[name] for name in names if name}
+
+    def users(self, usernames):
+        return self._resolve(
+            User, 'username', usernames,
+            lambda username: User(
+                username=username, password=make_password(None)
+            )
+        )
+
+    def groups(self, slugs):
+        return self._resolve(
+            Group, 'slug', slugs,
+            lambda slug: Group(title=slug, slug=slug, description='')
+        )
+
+
+def _date(value):
+    date = parse_datetime(value) if value else None
+    if date is None:
+        return timezone.now()
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def _id(value):
+    return int(value) if value not in (None, '') else None
+
+
+def _reject_reason(model, record, seen):
+    """Почему запись нельзя вставить, или ``None``."""
+    if not isinstance(record, dict):
+        return 'не объект JSON'
+    if not str(record.get('text') or '').strip():
+        return 'нет текста'
+    if model is Comment and not record.get('author'):
+        return 'нет автора'
+    try:
+        record_id = _id(record.get('id'))
+        _id(record.get('post'))
+        _date(record.get('pub_date'))
+        _date(record.get('created'))
+    except (TypeError, ValueError):
+        return 'неверное значение'
+    if record_id is not None:
+        if record_id in seen:
+            return 'повторный id'
+        seen.add(record_id)
+    return None
+
+
+def _valid_records(model, records, seen, rejects):
+    """Записи пачки, которые можно вставить; отказы считаются в rejects."""
+    valid = []
+    for record in records:
+        reason = _reject_reason(model, record, seen)
+        if reason is None:
+            valid.append(record)
+        else:
+            rejects[reason] += 1
+    existing = set(model.objects.filter(
+        pk__in={_id(record.get('id')) for record in valid} - {None}
+    ).values_list('pk', flat=True))
+    if existing:
+        rejects['id уже занят'] += sum(
+            _id(record.get('id')) in existing for record in valid
+        )
+        valid = [
+            record for record in valid
+            if _id(record.get('id')) not in existing
+        ]
+    return valid
+
+
+def _build_posts(records, lookup, rejects):
+    users = lookup.users({record.get('author') for record in records})
+    groups = lookup.groups({record.get('group') for record in records})
+    posts = []
+    for record in records:
+        pub_date = _date(record.get('pub_date'))
+        posts.append(Post(
+            id=_id(record.get('id')),
+            text=record['text'],
+            author_id=users.get(record.get('author')),
+            group_id=groups.get(record.get('group')),
+            image=record.get('image') or '',
+            pub_date=pub_date,
+            updated=pub_date,
+        ))
+    return posts
+
+
+def _build_comments(records, lookup, rejects):
+    users = lookup.users({record.get('author') for record in records})
+    post_ids = {_id(record.get('post')) for record in records}
+    existing = set(Post.objects.filter(pk__in=post_ids).values_list(
+        'pk', flat=True
+    ))
+    comments = []
+    for record in records:
+        if _id(record.get('post')) not in existing:
+            rejects['нет поста'] += 1
+            continue
+        comments.append(Comment(
+            id=_id(record.get('id')),
+            text=record['text'],
+            post_id=_id(record.get('post')),
+            author_id=users.get(record.get('author')),
+            created=_date(record.get('created')),
+        ))
+    return comments
+
+
+IMPORTS = {
+    'posts': (Post, _build_posts),
+    'comments': (Comment, _build_comments),
+}
+
+
+def import_file(path, kind, lookup, feeds, batch_size=BATCH_SIZE,
+                format_=None):
+    """Импортирует файл, возвращает (записано, отказы).
+
+    Отказы — ``Counter`` причин по пропущенным записям: не объекты
+    JSON, без текста, с повторным или уже занятым id, с неразборчивыми
+    значениями, комментарии к отсутствующим постам. Остальные записи
+    пачки вставляются. В ``feeds`` добавляются ленты, в которые попали
+    импортированные посты: их счётчики и кэш нужно сбросить, даже если
+    импорт прервётся ошибкой после первых пачек. Даты из файла
+    сохраняются только внутри ``preserved_dates``.
+    """
+    model, build = IMPORTS[kind]
+    written = 0
+    rejects = Counter()
+    seen = set()
+
+    def flush(records):
+        nonlocal written
+        objects = build(
+            _valid_records(model, records, seen, rejects), lookup, rejects
+        )
+        with transaction.atomic():
+            model.objects.bulk_create(objects, batch_size=batch_size)
+        written += len(objects)
+        if model is Post:
+            for post in objects:
+                feeds.update(feeds_for(post.author_id, post.group_id))
+
+    batch = []
+    for record in read_records(path, format_):
+        batch.append(record)
+        if len(batch) == batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return written, rejects
+
+
+def reset_sequences():
+    """Сдвигает последовательности id после вставки с явными id."""
+    sql = connection.ops.sequence_reset_sql(no_style(), [Post, Comment])
+    with connection.cursor() as cursor:
+        for statement in sql:
+            cursor.execute(statement)
@@ -0,0 +1,121 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.bench import Seeder
+from posts.models import Comment, Post
+from posts.views import POSTS_ON_PAGE
+
+BENCH_USERS = 50
+BENCH_GROUPS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет планы и время запросов лент. С --posts предварительно '
+        'заполняет текущую базу тестовыми данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=0,
+            help='Сколько постов добавить перед замером.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнять каждый запрос.'
+        )
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Повторить замер без индексов лент (изменения откатываются).'
+        )
+
+    def handle(self, *args, **options):
+        if options['posts']:
+            self.seed(options['posts'])
+        queries = self.feed_queries()
+        if not queries:
+            self.stderr.write('В базе нет постов: запустите с --posts.')
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING('С индексами'))
+        after = self.measure(queries, options['repeat'], 'after')
+        if not options['compare']:
+            return
+        with transaction.atomic():
+            self.drop_feed_indexes()
+            self.stdout.write(self.style.MIGRATE_HEADING('Без индексов'))
+            before = self.measure(queries, options['repeat'], 'before')
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.MIGRATE_HEADING('Итог'))
+        for name in queries:
+            self.stdout.write(
+                f'{name:<10} {before[name]:8.2f} мс -> {after[name]:8.2f} мс '
+                f'(x{before[name] / after[name]:.1f})'
+            )
+
+    def seed(self, count):
+        Seeder(log=self.stdout.write).seed(
+            count, users=BENCH_USERS, groups=BENCH_GROUPS
+        )
+        self.stdout.write(f'Добавлено постов: {count}')
+
+    def feed_queries(self):
+        post = Post.objects.order_by('-pk').first()
+        if post is None:
+            return {}
+        queries = {
+            'index': Post.objects.for_feed(),
+            'profile': Post.objects.for_feed().filter(
+                author_id=post.author_id
+            ),
+            'comments': Comment.objects.filter(post=post).order_by(
+                'created'
+            ),
+        }
+        group_id = Post.objects.exclude(group=None).values_list(
+            'group_id', flat=True
+        ).first()
+        if group_id is not None:
+            queries['group'] = Post.objects.for_feed().filter(
+                group_id=group_id
+            )
+        return {
+            name: queryset[:POSTS_ON_PAGE]
+            for name, queryset in queries.items()
+        }
+
+    def explain(self, queryset, marker):
+        sql, params = queryset.query.sql_with_params()
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            # sqlite3 кэширует подготовленные выражения вместе с планом:
+            # метка делает текст запроса другим после удаления индексов.
+            cursor.execute(f'{prefix} {sql} /* {marker} */', params)
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+
+    def measure(self, queries, repeat, marker):
+        timings = {}
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(name))
+            self.stdout.write(self.explain(queryset, marker))
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+            self.stdout.write(f'{best:.2f} мс\n')
+        return timings
+
+    def drop_feed_indexes(self):
+        with connection.cursor() as cursor:
+            for model in (Post, Comment):
+                for index in model._meta.indexes:
+                    cursor.execute(
+                        f'DROP INDEX {connection.ops.quote_name(index.name)}'
+                    )
@@ -0,0 +1,106 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.management.commands.bench_site import percentile
+from posts.bench import Seeder
+from posts.cache import POPULAR_FEED, bump_feed_generations
+from posts.models import PopularPost, Post
+from posts.popular import POPULAR_WINDOW, PopularPaginator, rank_popular_posts
+from posts.views import POSTS_ON_PAGE
+
+BENCH_USERS = 200
+BENCH_GROUPS = 20
+# Комментарии раскиданы по этому числу дней: в окно рейтинга
+# попадает заметная их доля.
+BENCH_DAYS = 30
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет популярную ленту при растущем числе постов: время '
+        'пересчёта рейтинга, ответа первой и последней страницы без кэша '
+        'и, для сравнения, ранжирования прямо в запросе. Недостающие '
+        'посты добавляются в текущую базу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10000, 100000],
+            help='При каком общем числе постов замерять.'
+        )
+        parser.add_argument(
+            '--comments', type=int, default=2,
+            help='Сколько комментариев добавлять на пост.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=30,
+            help='Сколько раз запрашивать каждую страницу.'
+        )
+
+    def handle(self, *args, **options):
+        client = Client()
+        self.stdout.write(
+            f'{"постов":>9} {"пересчёт, мс":>13} {"первая p50":>11} '
+            f'{"последняя p50":>14} {"запросов":>9} {"в запросе p50":>14}'
+        )
+        for size in sorted(options['sizes']):
+            missing = size - Post.objects.count()
+            if missing > 0:
+                Seeder(days=BENCH_DAYS).seed(
+                    missing, users=BENCH_USERS, groups=BENCH_GROUPS,
+                    comments=missing * options['comments']
+                )
+            started = time.perf_counter()
+            rank_popular_posts()
+            ranking = (time.perf_counter() - started) * 1000
+            first, queries = self.measure(
+                client, reverse('posts:popular'), options['requests']
+            )
+            last, _ = self.measure(
+                client, reverse('posts:popular') + self.last_page(),
+                options['requests']
+            )
+            inline = self.measure_inline(options['requests'])
+            self.stdout.write(
+                f'{Post.objects.count():>9} {ranking:>13.0f} '
+                f'{first:>11.2f} {last:>14.2f} {queries:>9} {inline:>14.2f}'
+            )
+
+    def last_page(self):
+        """Курсор страницы, с которой начинается хвост ленты."""
+        ranked = PopularPost.objects.order_by('score', 'post_id')
+        anchor = ranked[POSTS_ON_PAGE:POSTS_ON_PAGE + 1].first()
+        if anchor is None:
+            return ''
+        cursor = PopularPaginator(POSTS_ON_PAGE).encode_cursor(anchor, 'n')
+        return f'?cursor={cursor}'
+
+    def measure(self, client, url, requests):
+        timings = []
+        for _ in range(requests):
+            # Новое поколение ленты: страница собирается заново.
+            bump_feed_generations([POPULAR_FEED])
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                client.get(url)
+                timings.append(time.perf_counter() - started)
+        return percentile(timings, 50) * 1000, len(queries)
+
+    def measure_inline(self, requests):
+        since = timezone.now() - POPULAR_WINDOW
+        queryset = Post.objects.for_feed().annotate(
+            recent=Count('comments', filter=Q(comments__created__gte=since))
+        ).filter(recent__gt=0).order_by('-recent', '-id')[:POSTS_ON_PAGE]
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append(time.perf_counter() - started)
+        return percentile(timings, 50) * 1000
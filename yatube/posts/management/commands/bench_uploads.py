@@ -0,0 +1,107 @@
+import io
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import load_handler
+from django.core.management.base import BaseCommand
+from django.test.client import (BOUNDARY, MULTIPART_CONTENT, RequestFactory,
+                                encode_multipart)
+from PIL import Image
+
+from posts.uploads import EXIF_ORIENTATION, BoundedImageField
+
+VARIANTS = (
+    ('django', settings.FILE_UPLOAD_HANDLERS, forms.ImageField),
+    ('bounded', ['posts.uploads.BoundedImageUploadHandler'],
+     BoundedImageField),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пиковую память и время приёма картинок при параллельных '
+        'загрузках со стандартными и ограниченными обработчиками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uploads', type=int, default=32,
+            help='Сколько загрузок выполнить.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Сколько загрузок выполнять одновременно.'
+        )
+        parser.add_argument(
+            '--width', type=int, default=4000,
+            help='Ширина картинки.'
+        )
+        parser.add_argument(
+            '--height', type=int, default=3000,
+            help='Высота картинки.'
+        )
+        parser.add_argument(
+            '--rotated', action='store_true',
+            help='Записать в EXIF поворот, который придётся применить.'
+        )
+
+    def handle(self, *args, **options):
+        body = self.request_body(
+            options['width'], options['height'], options['rotated']
+        )
+        self.stdout.write(f'Размер запроса: {len(body) / 2 ** 20:.1f} МБ')
+        for name, handlers, field_class in VARIANTS:
+            requests = [
+                RequestFactory().generic(
+                    'POST', '/create/', body, content_type=MULTIPART_CONTENT
+                ) for _ in range(options['uploads'])
+            ]
+            # Тела запросов созданы до начала замера и в пик не входят.
+            # tracemalloc не видит буферы Pillow, только объекты Python.
+            tracemalloc.start()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                latencies = list(executor.map(
+                    lambda request: self.upload(
+                        request, handlers, field_class
+                    ),
+                    requests
+                ))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f'{name:<8} пик памяти {peak / 2 ** 20:8.1f} МБ, '
+                f'p50 {statistics.median(latencies):7.1f} мс, '
+                f'p95 {p95:7.1f} мс'
+            )
+
+    def request_body(self, width, height, rotated):
+        # Шум плохо сжимается, так что файл близок к настоящей фотографии.
+        image = Image.effect_noise((width, height), 64).convert('RGB')
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6 if rotated else 1
+        exif[0x010F] = 'Камера'
+        content = io.BytesIO()
+        image.save(content, 'JPEG', quality=90, exif=exif.tobytes())
+        return encode_multipart(BOUNDARY, {
+            'text': 'Пост для замеров',
+            'image': SimpleUploadedFile(
+                'photo.jpg', content.getvalue(), content_type='image/jpeg'
+            ),
+        })
+
+    def upload(self, request, handlers, field_class):
+        started = time.perf_counter()
+        request.upload_handlers = [
+            load_handler(handler, request) for handler in handlers
+        ]
+        image = request.FILES['image']
+        field_class().clean(image)
+        image.close()
+        return (time.perf_counter() - started) * 1000
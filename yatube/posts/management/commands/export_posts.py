@@ -0,0 +1,87 @@
+import sys
+from argparse import ArgumentTypeError
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from posts.export import EXPORTS, FORMATS, export_rows
+
+
+def date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ArgumentTypeError(f'Некорректная дата: {value}')
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты или комментарии в NDJSON или CSV, не загружая '
+        'их в память целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument(
+            '--format', choices=list(FORMATS), default='ndjson'
+        )
+        parser.add_argument(
+            '--output', help='Файл для выгрузки, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--since', type=date, help='С даты (ГГГГ-ММ-ДД) включительно.'
+        )
+        parser.add_argument(
+            '--until', type=date, help='По дату (ГГГГ-ММ-ДД) включительно.'
+        )
+        parser.add_argument('--group', help='Slug группы.')
+        parser.add_argument('--author', help='Имя пользователя автора.')
+        parser.add_argument(
+            '--after', type=int, default=0,
+            help='Продолжить после строки с этим id (токен продолжения).'
+        )
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        lines = FORMATS[options['format']][0]
+        last_id = options['after']
+
+        def rows():
+            nonlocal last_id
+            for row in export_rows(
+                kind,
+                since=options['since'], until=options['until'],
+                group=options['group'], author=options['author'],
+                after=options['after'],
+            ):
+                yield row
+                last_id = row[0]
+
+        if options['output']:
+            # Продолжение дописывает файл, а не перезаписывает его.
+            output = open(
+                options['output'], 'a' if options['after'] else 'w',
+                encoding='utf-8'
+            )
+            write = output.write
+        else:
+            output = None
+            write = partial(self.stdout.write, ending='')
+        try:
+            for line in lines(
+                EXPORTS[kind].names, rows(), header=not options['after']
+            ):
+                write(line)
+        except KeyboardInterrupt:
+            self.stderr.write(
+                f'Выгрузка прервана. Продолжить: --after {last_id}'
+            )
+            sys.exit(1)
+        finally:
+            if output is not None:
+                output.close()
+        self.stderr.write(f'Готово. Последний id: {last_id}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import (cached_post_thumbnails, generate_thumbnails,
+                              post_thumbnail_variants)
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие миниатюры картинок постов, например для '
+        'картинок, загруженных до перезапуска фоновых потоков.'
+    )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct().order_by()
+        variants = len(list(post_thumbnail_variants()))
+        created = 0
+        for name in names.iterator():
+            if len(cached_post_thumbnails(name)) < variants:
+                generate_thumbnails(name)
+                created += 1
+        self.stdout.write(f'Обработано картинок: {created}')
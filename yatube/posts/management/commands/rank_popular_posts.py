@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.popular import POPULAR_FEED_SIZE, rank_popular_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярной ленты. Запускается по '
+        'расписанию или с --every как фоновый процесс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=0, metavar='SECONDS',
+            help='Пересчитывать в цикле с таким интервалом.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=POPULAR_FEED_SIZE,
+            help='Сколько постов хранить в ленте.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            ranked = rank_popular_posts(limit=options['limit'])
+            self.stdout.write(
+                f'Постов в популярной ленте: {ranked} '
+                f'({(time.perf_counter() - started) * 1000:.0f} мс)'
+            )
+            if not options['every']:
+                return
+            # Между пересчётами соединение не держим.
+            connections.close_all()
+            time.sleep(options['every'])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.search import is_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересоздаёт полнотекстовый индекс постов и его триггеры '
+        'по текущему содержимому таблицы постов.'
+    )
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError(
+                'Полнотекстовый поиск доступен только в SQLite.'
+            )
+        rebuild_search_index()
+        self.stdout.write('Индекс поиска пересоздан.')
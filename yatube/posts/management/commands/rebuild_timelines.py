@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Follow, User
+from posts.timelines import FANOUT_BATCH_SIZE, rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок: после импорта, изменения '
+        'FOLLOW_FANOUT_LIMIT или сбоя раскладки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Чьи ленты пересобрать, по умолчанию — всех подписчиков.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=FANOUT_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        if options['usernames']:
+            user_ids = User.objects.filter(
+                username__in=options['usernames']
+            ).values_list('pk', flat=True)
+        else:
+            user_ids = Follow.objects.order_by('user_id').values_list(
+                'user_id', flat=True
+            ).distinct()
+        users = written = 0
+        for user_id in user_ids.iterator():
+            written += rebuild_timeline(user_id, options['batch_size'])
+            users += 1
+        self.stdout.write(f'Пересобрано лент: {users}, строк: {written}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import SITE_FEED, bump_feed_generations
+from posts.counters import recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов и комментариев '
+        'и исправляет расхождения.'
+    )
+
+    def handle(self, *args, **options):
+        fixed = recount()
+        for counter, rows in fixed.items():
+            self.stdout.write(f'{counter}: исправлено строк {rows}')
+        if any(fixed.values()):
+            bump_feed_generations([SITE_FEED])
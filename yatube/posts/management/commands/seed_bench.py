@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.bench import BATCH_SIZE, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет текущую базу правдоподобными данными для замеров: '
+        'популярные авторы и группы получают большую часть постов, '
+        'свежие посты — большую часть комментариев.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument(
+            '--comments', type=int, default=None,
+            help='Сколько комментариев добавить, по умолчанию — '
+                 'вдвое больше, чем постов.'
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.1,
+            help='Доля постов с картинкой.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты публикации.'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        comments = options['comments']
+        if comments is None:
+            comments = options['posts'] * 2
+        seeder = Seeder(
+            days=options['days'], batch_size=options['batch_size'],
+            log=self.stdout.write
+        )
+        started = time.perf_counter()
+        seeder.seed(
+            options['posts'], users=options['users'],
+            groups=options['groups'], comments=comments,
+            image_share=options['images']
+        )
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - started:.1f} с, '
+            f'префикс {seeder.prefix}. Миниатюры картинок создаёт '
+            f'generate_thumbnails.'
+        )
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 
 User = get_user_model()
 
@@ -9,14 +11,33 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для ленты: автор и группа одним запросом, без лишних полей."""
+        return self.select_related('author', 'group').only(
+            'text',
+            'pub_date',
+            'updated',
+            'image',
+            'comments_count',
+            'author__username',
+            'author__first_name',
+            'author__last_name',
+            'group__slug',
+            'group__title',
+        ).order_by('-pub_date', '-id')
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(
         User,
         null=True,
@@ -36,12 +57,63 @@ class Post(models.Model):
     image = models.ImageField(
         'Image',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # Все ленты сортируются по (-pub_date, -id), в том числе
+        # внутри автора и группы.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+            # Одну картинку могут использовать несколько постов: файл
+            # удаляется, когда ссылок на него не остаётся.
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        # Счётчики обновляются сигналами в той же транзакции.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class StoredImage(models.Model):
+    """Файл картинки в ``ContentAddressedStorage``.
+
+    Строка служит блокировкой имени: сохранение, которое переиспользует
+    существующий файл, и удаление неиспользуемого файла берут её до
+    конца своей транзакции. Поэтому файл не удаляется, пока пост,
+    который на него сослался, ещё не закоммичен.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+
+    @classmethod
+    def lock(cls, name):
+        """Блокирует имя файла до конца текущей транзакции."""
+        # UPDATE без изменений тоже берёт блокировку записи.
+        if not cls.objects.filter(name=name).update(name=name):
+            cls.objects.get_or_create(name=name)
+
+    def __str__(self):
+        return self.name
+
 
 class Comment(models.Model):
     text = models.TextField(verbose_name='Текст комментария')
@@ -59,5 +131,127 @@ class Comment(models.Model):
         related_name='comments'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+            # Окно свежих комментариев для рейтинга популярной ленты.
+            models.Index(fields=['created'], name='comment_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class AuthorStats(models.Model):
+    """Счётчики автора: модель пользователя из django.contrib.auth
+    нельзя дополнить своими полями."""
+    author = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    # По нему решается, раскладывать ли посты автора по лентам
+    # подписчиков, см. posts.timelines.
+    followers_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.author}: {self.posts_count}'
+
+
+class Follow(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follower'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='following'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='follow_not_self'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} -> {self.author}'
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок читателя.
+
+    Строки раскладываются при публикации, поэтому лента читается
+    по одному индексу. Дата публикации копируется из поста, чтобы
+    сортировать без соединения с posts_post.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.post_id}'
+
+
+class PopularPost(models.Model):
+    """Пост популярной ленты с заранее посчитанным рейтингом.
+
+    Таблица целиком пересобирается командой ``rank_popular_posts``
+    и хранит не больше ``POPULAR_FEED_SIZE`` строк, поэтому лента
+    читается по одному индексу независимо от общего числа постов.
+    """
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-score', '-post'],
+                name='popular_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.3f}'
@@ -0,0 +1,253 @@
+import base64
+import binascii
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import connection
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+from .cache import FEED_COUNT_TIMEOUT, count_key
+
+# Номерные ссылки ?page=N дешёвы только на первых страницах,
+# глубже лента листается курсором.
+MAX_OFFSET_PAGE = 50
+# Выше этого порога точный COUNT(*) заменяется оценкой.
+APPROXIMATE_COUNT_AFTER = 10000
+PAGES_AROUND_CURRENT = 2
+ELLIPSIS = '…'
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage(Page):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу сортировки вместо OFFSET.
+
+    Каждая страница выбирается условием «после/до последней записи»,
+    поэтому её стоимость не зависит от глубины и не требует COUNT(*).
+    Поля ``ordering`` должны сортироваться в одном направлении и
+    однозначно задавать порядок (последнее поле — уникальное).
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        if not object_list.ordered:
+            # Иначе Paginator предупреждает о неупорядоченном списке.
+            # Наследники с ключом не из полей object_list передают
+            # список уже упорядоченным.
+            object_list = object_list.order_by(*ordering)
+        super().__init__(object_list, per_page)
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.descending = ordering[0].startswith('-')
+
+    def cursor_values(self, obj):
+        """Значения ключа сортировки объекта в виде, пригодном для JSON."""
+        return [
+            self.object_list.model._meta.get_field(name).value_to_string(obj)
+            for name in self.fields
+        ]
+
+    def parse_cursor_values(self, values):
+        model = self.object_list.model
+        return [
+            model._meta.get_field(name).to_python(value)
+            for name, value in zip(self.fields, values)
+        ]
+
+    def encode_cursor(self, obj, direction):
+        raw = json.dumps([direction] + self.cursor_values(obj)).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, *values = json.loads(raw.decode())
+            if direction not in ('n', 'p') or len(values) != len(self.fields):
+                raise ValueError
+            values = self.parse_cursor_values(values)
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise InvalidCursor('Некорректный курсор')
+        return direction, values
+
+    def keyset_filter(self, values, forward, fields=None):
+        """Условие «строго после values» в порядке выдачи (или до него).
+
+        ``fields`` — те же поля под другими именами, если условие
+        строится для другой таблицы.
+        """
+        fields = fields or self.fields
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for index, name in enumerate(fields):
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for previous, value in zip(fields[:index], values):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def fetch(self, values, forward, limit):
+        """Первые ``limit`` записей после ``values`` в порядке обхода."""
+        queryset = self.object_list.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+    def page(self, cursor=None):
+        forward = True
+        values = None
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+            forward = direction == 'n'
+        object_list = self.fetch(values, forward, self.per_page + 1)
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if not forward:
+            object_list.reverse()
+        if forward:
+            has_next, has_previous = has_more, bool(cursor)
+        else:
+            has_next, has_previous = True, has_more
+        if not object_list:
+            return CursorPage(object_list, self)
+        return CursorPage(
+            object_list,
+            self,
+            next_cursor=(
+                self.encode_cursor(object_list[-1], 'n') if has_next else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(object_list[0], 'p')
+                if has_previous else None
+            ),
+        )
+
+    def get_page(self, cursor=None):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+class CountedPage(Page):
+    is_cursor = False
+
+    @property
+    def last_page_number(self):
+        return min(self.paginator.num_pages, MAX_OFFSET_PAGE)
+
+    @property
+    def elided_page_range(self):
+        return self.paginator.get_elided_page_range(self.number)
+
+    def has_next(self):
+        return self.number < self.last_page_number
+
+
+class CachedCountPaginator(Paginator):
+    """Номерной пагинатор с количеством записей из кэша.
+
+    Количество хранится под ключом ленты ``feed`` и сбрасывается
+    сигналами при создании и удалении постов.
+    """
+
+    def __init__(self, object_list, per_page, feed,
+                 approximate_after=APPROXIMATE_COUNT_AFTER):
+        super().__init__(object_list, per_page)
+        self.feed = feed
+        self.approximate_after = approximate_after
+
+    @cached_property
+    def count(self):
+        key = count_key(self.feed)
+        count = cache.get(key)
+        if count is None:
+            count = self.compute_count()
+            cache.set(key, count, FEED_COUNT_TIMEOUT)
+        return count
+
+    def compute_count(self):
+        queryset = self.object_list.order_by()
+        if self.approximate_after is None:
+            return queryset.count()
+        count = queryset[:self.approximate_after + 1].count()
+        if count <= self.approximate_after:
+            return count
+        return max(count, self.estimate_count(queryset))
+
+    def estimate_count(self, queryset):
+        if connection.vendor == 'postgresql':
+            plan = queryset.explain()
+            return int(plan.split(' rows=')[1].split()[0])
+        if not queryset.query.where:
+            # Первичные ключи растут монотонно: максимум — оценка сверху.
+            return queryset.aggregate(estimate=Max('pk'))['estimate'] or 0
+        return queryset.count()
+
+    def get_elided_page_range(self, number,
+                              on_each_side=PAGES_AROUND_CURRENT, on_ends=1):
+        """Первые, последние и соседние с текущей страницы через «…»."""
+        last = min(self.num_pages, MAX_OFFSET_PAGE)
+        pages = sorted(
+            set(range(1, min(on_ends, last) + 1))
+            | set(range(
+                max(1, number - on_each_side),
+                min(last, number + on_each_side) + 1
+            ))
+            | set(range(max(1, last - on_ends + 1), last + 1))
+        )
+        result = []
+        for page in pages:
+            if result and page - result[-1] > 1:
+                result.append(ELLIPSIS)
+            result.append(page)
+        if last < self.num_pages:
+            result.append(ELLIPSIS)
+        return result
+
+    def _get_page(self, *args, **kwargs):
+        return CountedPage(*args, **kwargs)
+
+
+def paginate(request, object_list, per_page, feed):
+    """Страница ленты по параметрам запроса.
+
+    ``?cursor=`` листает по ключу, старые ссылки ``?page=N`` обслуживаются
+    номерным пагинатором, пока N не больше MAX_OFFSET_PAGE. ``feed`` —
+    имя ленты, под которым кэшируется количество её постов.
+    """
+    cursor = request.GET.get('cursor')
+    page_number = request.GET.get('page')
+    if cursor is None and page_number is not None:
+        try:
+            is_shallow = 0 < int(page_number) <= MAX_OFFSET_PAGE
+        except ValueError:
+            is_shallow = False
+        if is_shallow:
+            paginator = CachedCountPaginator(object_list, per_page, feed)
+            return paginator.get_page(page_number)
+    return CursorPaginator(object_list, per_page).get_page(cursor)
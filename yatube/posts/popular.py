@@ -0,0 +1,109 @@
+"""Популярная лента: посты с самыми активными свежими обсуждениями.
+
+Рейтинг поста — сумма его комментариев за ``POPULAR_WINDOW``, где
+вклад каждого комментария вдвое меньше через каждые
+``POPULAR_HALF_LIFE``. Считается он не при запросе, а командой
+``rank_popular_posts`` (по расписанию или с ``--every``): лучшие
+``POPULAR_FEED_SIZE`` постов записываются в ``PopularPost``, и
+страница ленты — это один проход по индексу этой таблицы.
+"""
+import datetime
+import heapq
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .cache import POPULAR_FEED, bump_feed_generations
+from .models import Comment, PopularPost, Post
+from .paginators import CursorPaginator
+
+POPULAR_HALF_LIFE = datetime.timedelta(hours=24)
+# Старше окна вклад комментария меньше 1/128 и не учитывается.
+POPULAR_WINDOW = POPULAR_HALF_LIFE * 7
+POPULAR_FEED_SIZE = 1000
+
+
+def compute_scores(now=None, limit=POPULAR_FEED_SIZE):
+    """Лучшие ``limit`` пар ``(post_id, score)`` по убыванию рейтинга.
+
+    Комментарии окна читаются по индексу даты уже сгруппированными
+    по посту и часу, так что в память попадает не больше строки
+    на пост в час.
+    """
+    now = now or timezone.now()
+    buckets = Comment.objects.filter(
+        created__gte=now - POPULAR_WINDOW, post__isnull=False
+    ).annotate(hour=TruncHour('created')).values('post_id', 'hour').annotate(
+        comments=Count('pk')
+    ).order_by()
+    half_life = POPULAR_HALF_LIFE.total_seconds()
+    scores = defaultdict(float)
+    for row in buckets.iterator():
+        # Середина часа: так оценка в среднем не смещена.
+        age = (now - row['hour']).total_seconds() - 30 * 60
+        scores[row['post_id']] += row['comments'] * 0.5 ** (
+            max(age, 0) / half_life
+        )
+    return heapq.nlargest(
+        limit, scores.items(), key=lambda item: (item[1], item[0])
+    )
+
+
+def rank_popular_posts(now=None, limit=POPULAR_FEED_SIZE):
+    """Пересобирает ``PopularPost``, возвращает число постов в ленте."""
+    ranked = compute_scores(now, limit)
+    with transaction.atomic():
+        # Пост могли удалить, пока считался рейтинг.
+        existing = set(Post.objects.filter(
+            pk__in=[post_id for post_id, _ in ranked]
+        ).values_list('pk', flat=True))
+        PopularPost.objects.all().delete()
+        PopularPost.objects.bulk_create(
+            PopularPost(post_id=post_id, score=score)
+            for post_id, score in ranked if post_id in existing
+        )
+    bump_feed_generations([POPULAR_FEED])
+    return len(existing)
+
+
+class PopularPaginator(CursorPaginator):
+    """Курсорная популярная лента в порядке (-score, -id).
+
+    Ключ страницы выбирается из ``PopularPost``, посты догружаются
+    по первичному ключу.
+    """
+
+    def __init__(self, per_page):
+        super().__init__(
+            Post.objects.for_feed(), per_page, ordering=('-score', '-id')
+        )
+
+    def cursor_values(self, obj):
+        return [obj.score, obj.pk]
+
+    def parse_cursor_values(self, values):
+        score, post_id = values
+        return [float(score), int(post_id)]
+
+    def fetch(self, values, forward, limit):
+        ranked = PopularPost.objects.all()
+        if values is not None:
+            ranked = ranked.filter(self.keyset_filter(
+                values, forward, fields=('score', 'post_id')
+            ))
+        ordering = ('-score', '-post_id') if forward else (
+            'score', 'post_id'
+        )
+        scores = dict(ranked.order_by(*ordering).values_list(
+            'post_id', 'score'
+        )[:limit])
+        posts = self.object_list.in_bulk(list(scores))
+        result = []
+        for post_id, score in scores.items():
+            if post_id in posts:
+                posts[post_id].score = score
+                result.append(posts[post_id])
+        return result
@@ -0,0 +1,165 @@
+import re
+import secrets
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import CursorPaginator
+
+SEARCH_TABLE = 'posts_post_fts'
+SNIPPET_TOKENS = 24
+# Совпадения отмечаются до экранирования HTML метками из символов
+# частной области Unicode со случайной серединой, новой для каждого
+# поиска: текст поста не может их содержать и вставить свою разметку.
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+# Индекс хранит только словарь: текст берётся из posts_post. Триггеры
+# держат его в согласии с таблицей при любых изменениях, включая
+# bulk_create и update(). SQLite удаляет триггеры, когда Django
+# пересоздаёт таблицу в миграции, поэтому индекс восстанавливается
+# после каждого migrate (см. ensure_search_index).
+SCHEMA = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+TRIGGERS = ('insert', 'delete', 'update')
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def rebuild_search_index():
+    with connection.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"
+        )
+
+
+def ensure_search_index(**kwargs):
+    """Создаёт индекс и триггеры, если их нет, и тогда же заполняет индекс."""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND name IN (%s, %s, %s)",
+            [f'{SEARCH_TABLE}_{trigger}' for trigger in TRIGGERS]
+        )
+        if cursor.fetchone()[0] == len(TRIGGERS):
+            return
+    rebuild_search_index()
+
+
+def match_expression(text):
+    """Запрос FTS5 из слов пользователя: все слова, последнее — префиксом."""
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def matching_ids(text):
+    """Подзапрос id постов, подходящих под запрос, для ``pk__in``."""
+    return RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match_expression(text)]
+    )
+
+
+def match_markers():
+    token = secrets.token_hex(8)
+    return MATCH_START + token + MATCH_END, MATCH_END + token + MATCH_START
+
+
+def highlight(snippet, markers):
+    start, end = markers
+    return mark_safe(
+        escape(snippet).replace(start, '<mark>').replace(end, '</mark>')
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная выдача поиска по релевантности (bm25), затем по id.
+
+    Курсор хранит ранг и id последней записи, поэтому страницы
+    выбираются условием по ним, как и в лентах.
+    """
+
+    def __init__(self, text, per_page):
+        super().__init__(
+            Post.objects.for_feed(), per_page, ordering=('rank', 'id')
+        )
+        self.match = match_expression(text)
+        self.markers = match_markers()
+
+    def cursor_values(self, obj):
+        return [obj.search_rank, obj.pk]
+
+    def parse_cursor_values(self, values):
+        return [float(values[0]), int(values[1])]
+
+    def fetch(self, values, forward, limit):
+        if self.match is None:
+            return []
+        sql = (
+            f'SELECT rowid, rank, snippet({SEARCH_TABLE}, 0, %s, %s, %s, %s) '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+        )
+        params = [*self.markers, '…', SNIPPET_TOKENS, self.match]
+        if values is not None:
+            operator = '>' if forward else '<'
+            sql += (
+                f' AND (rank {operator} %s '
+                f'OR (rank = %s AND rowid {operator} %s))'
+            )
+            params += [values[0], values[0], values[1]]
+        direction = '' if forward else ' DESC'
+        sql += f' ORDER BY rank{direction}, rowid{direction} LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        posts = self.object_list.in_bulk([row[0] for row in rows])
+        results = []
+        for post_id, rank, snippet in rows:
+            post = posts.get(post_id)
+            if post is not None:
+                post.search_rank = rank
+                post.search_snippet = highlight(snippet, self.markers)
+                results.append(post)
+        return results
@@ -0,0 +1,171 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import (SITE_FEED, bump_feed_generations, feeds_for,
+                    forget_object_ids, group_id_key, invalidate_feed_counts,
+                    post_feeds, user_id_key)
+from .counters import (change_comments_count, change_followers_count,
+                       change_posts_count)
+from .models import Comment, Follow, Group, Post, User
+from .thumbnails import release_image, schedule_thumbnails
+from .timelines import followed, post_published, unfollowed
+
+# Поля пользователя, которые выводятся в карточках постов.
+USER_FEED_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    instance._saved_author_id = instance.__dict__.get('author_id')
+    instance._saved_group_id = instance.__dict__.get('group_id')
+    instance._saved_image = image_name(instance)
+
+
+def image_name(post):
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    feeds = post_feeds(instance)
+    if created:
+        old_feeds = []
+        change_posts_count(instance.author_id, instance.group_id, 1)
+        if instance.author_id is not None:
+            post_published(instance)
+    else:
+        old_author_id = instance._saved_author_id
+        old_group_id = instance._saved_group_id
+        old_feeds = feeds_for(old_author_id, old_group_id)
+        # Пост сменил автора или группу: счётчики переносятся.
+        moved_author = old_author_id != instance.author_id
+        moved_group = old_group_id != instance.group_id
+        if moved_author or moved_group:
+            change_posts_count(
+                old_author_id if moved_author else None,
+                old_group_id if moved_group else None,
+                -1
+            )
+            change_posts_count(
+                instance.author_id if moved_author else None,
+                instance.group_id if moved_group else None,
+                1
+            )
+    invalidate_feed_counts(set(feeds) ^ set(old_feeds))
+    bump_feed_generations(set(feeds) | set(old_feeds))
+    # Миниатюры готовятся в фоне, а не при первом показе поста.
+    if image_name(instance) != instance._saved_image:
+        schedule_thumbnails(image_name(instance))
+        if not created:
+            release_image(instance._saved_image)
+    instance._saved_author_id = instance.author_id
+    instance._saved_group_id = instance.group_id
+    instance._saved_image = image_name(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    author_id = instance._saved_author_id
+    group_id = instance._saved_group_id
+    change_posts_count(author_id, group_id, -1)
+    release_image(instance._saved_image)
+    feeds = feeds_for(author_id, group_id)
+    invalidate_feed_counts(feeds)
+    bump_feed_generations(feeds)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created and instance.post_id is not None:
+        comment_count_changed(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id is not None:
+        comment_count_changed(instance.post_id, -1)
+
+
+def comment_count_changed(post_id, delta):
+    change_comments_count(post_id, delta)
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if post is not None:
+        bump_feed_generations(feeds_for(*post))
+
+
+@receiver(post_init, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._saved_slug = instance.__dict__.get('slug')
+
+
+def forget_group_id(group):
+    # После смены slug старый не должен указывать на группу.
+    forget_object_ids({
+        group_id_key(group.slug), group_id_key(group._saved_slug)
+    })
+    group._saved_slug = group.slug
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    forget_group_id(instance)
+    if created:
+        return
+    # Карточки постов группы выводят её slug: обновляем их версию.
+    instance.posts.update(updated=timezone.now())
+    bump_feed_generations([SITE_FEED])
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    forget_group_id(instance)
+    bump_feed_generations([SITE_FEED])
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._saved_username = instance.__dict__.get('username')
+
+
+def forget_user_id(user):
+    forget_object_ids({
+        user_id_key(user.username), user_id_key(user._saved_username)
+    })
+    user._saved_username = user.username
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if update_fields and not USER_FEED_FIELDS & set(update_fields):
+        return
+    forget_user_id(instance)
+    if created:
+        return
+    instance.posts.update(updated=timezone.now())
+    bump_feed_generations([SITE_FEED])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    forget_user_id(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+    followers_count = change_followers_count(instance.author_id, 1)
+    followed(instance.user_id, instance.author_id, followers_count)
+    # На странице автора выводятся число подписчиков и кнопка подписки.
+    bump_feed_generations([f'profile:{instance.author_id}'])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    followers_count = change_followers_count(instance.author_id, -1)
+    unfollowed(instance.user_id, instance.author_id, followers_count)
+    bump_feed_generations([f'profile:{instance.author_id}'])
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит каждый файл один раз под хэшем его содержимого.
+
+    От исходного имени остаются только каталог и расширение, поэтому
+    одинаковые картинки получают одно имя и общие миниатюры.
+    Удалять файл можно только когда на него больше никто не ссылается
+    и только под блокировкой ``StoredImage``, которую берёт и ``save``.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        temp_dir = self.path(directory)
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        # Хэш считается по ходу записи во временный файл рядом с итоговым,
+        # так что загрузка не читается в память целиком.
+        temp = tempfile.NamedTemporaryFile(dir=temp_dir, delete=False)
+        try:
+            with temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = posixpath.join(
+                directory, hexdigest[:2], hexdigest + extension
+            )
+            # Модели импортируют хранилище, поэтому импорт здесь.
+            from .models import StoredImage
+            StoredImage.lock(name)
+            if not self.exists(name):
+                full_path = self.path(name)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                file_move_safe(temp.name, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temp.name):
+                os.remove(temp.name)
+        return name
@@ -0,0 +1,36 @@
+from django import template
+
+from posts.thumbnails import (FALLBACK_FORMAT, FALLBACK_WIDTH,
+                              POST_THUMBNAIL_FORMATS, cached_post_thumbnails)
+
+register = template.Library()
+
+# Картинка занимает всю ширину колонки, но не шире контейнера.
+POST_IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+
+
+def _srcset(thumbnails, format_):
+    return ', '.join(
+        f'{thumbnail.url} {width}w'
+        for (thumbnail_format, width), thumbnail in sorted(thumbnails.items())
+        if thumbnail_format == format_
+    )
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post):
+    """Адаптивная картинка поста или заглушка, пока миниатюры создаются."""
+    thumbnails = cached_post_thumbnails(post.image)
+    sources = [
+        {'type': f'image/{format_.lower()}',
+         'srcset': _srcset(thumbnails, format_)}
+        for format_ in POST_THUMBNAIL_FORMATS
+        if format_ != FALLBACK_FORMAT
+    ]
+    return {
+        'post': post,
+        'fallback': thumbnails.get((FALLBACK_FORMAT, FALLBACK_WIDTH)),
+        'srcset': _srcset(thumbnails, FALLBACK_FORMAT),
+        'sources': [source for source in sources if source['srcset']],
+        'sizes': POST_IMAGE_SIZES,
+    }
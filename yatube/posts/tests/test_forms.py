@@ -1,14 +1,19 @@
+import hashlib
+import io
 import shutil
 import tempfile
 
-from django.conf import settings
+from django import forms
+from django.conf import global_settings, settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..forms import PostForm
 from ..models import Post, Group, Comment
+from ..uploads import strip_jpeg_metadata
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -111,10 +116,64 @@ class PostCreateFormTests(TestCase):
             reverse('posts:profile', kwargs={'username': self.user.username})
         )
         self.assertEqual(Post.objects.count(), post_count + 1)
+        # Картинки хранятся под хэшем содержимого.
+        digest = hashlib.sha256(picture).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 text='test_post',
                 group=self.group.id,
-                image='posts/picture.gif'
+                image=f'posts/{digest[:2]}/{digest}.gif'
             ).exists()
         )
+
+    def upload(self, image, name, **params):
+        content = io.BytesIO()
+        image.save(content, **params)
+        return SimpleUploadedFile(
+            name=name, content=content.getvalue(), content_type='image/jpeg'
+        )
+
+    def test_decompression_bomb_is_rejected(self):
+        post_count = Post.objects.count()
+        bomb = self.upload(Image.new('1', (8000, 6000)), 'bomb.png',
+                           format='PNG')
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'test_post', 'image': bomb},
+        )
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 40 мегапикселей.'
+        )
+        self.assertEqual(Post.objects.count(), post_count)
+
+    def test_exif_orientation_is_applied_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        photo = self.upload(Image.new('RGB', (40, 20)), 'photo.jpg',
+                            format='JPEG', exif=exif.tobytes())
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'photo_post', 'image': photo},
+        )
+        post = Post.objects.get(text='photo_post')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertNotIn('exif', image.info)
+
+    def test_broken_jpeg_segment_is_rejected(self):
+        # Длина сегмента меньше двух байт, которые она занимает сама.
+        broken = io.BytesIO(b'\xff\xd8\xff\xe0\x00\x01')
+        with self.assertRaises(forms.ValidationError):
+            strip_jpeg_metadata(broken, io.BytesIO())
+
+    def test_upload_handlers_are_replaced_only_for_posts(self):
+        self.assertEqual(
+            settings.FILE_UPLOAD_HANDLERS,
+            global_settings.FILE_UPLOAD_HANDLERS
+        )
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:post_create'), data={'text': 'без токена'}
+        )
+        self.assertEqual(response.status_code, 403)
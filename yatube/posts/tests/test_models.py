@@ -1,6 +1,17 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from ..models import Post, Group
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ..models import (AuthorStats, Comment, Follow, Post, Group,
+                      StoredImage, TimelineEntry)
 
 
 User = get_user_model()
@@ -39,3 +50,258 @@ class PostModelTest(TestCase):
     def test_object_name_is_text_fild(self):
         post = PostModelTest.post
         self.assertEqual(post.text, str(post))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, author_posts, group_posts, other_group_posts):
+        self.user.stats.refresh_from_db()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, author_posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        self.assertEqual(self.other_group.posts_count, other_group_posts)
+
+    def test_post_counters(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group
+        )
+        Post.objects.create(author=self.user, text='Пост без группы')
+        self.assertCounters(2, 1, 0)
+        post.group = self.other_group
+        post.save()
+        self.assertCounters(2, 0, 1)
+        post.delete()
+        self.assertCounters(1, 0, 0)
+
+    def test_comment_counter(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        comments = [
+            Comment.objects.create(post=post, author=self.user, text='1'),
+            Comment.objects.create(post=post, author=self.user, text='2'),
+        ]
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        comments[0].delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.user, text='1')
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=0)
+        AuthorStats.objects.all().delete()
+        call_command('recount_counters', stdout=StringIO())
+        self.user.refresh_from_db()
+        post.refresh_from_db()
+        self.assertCounters(1, 1, 0)
+        self.assertEqual(post.comments_count, 1)
+
+
+class ImportPostsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        return path
+
+    def test_import_posts_and_comments(self):
+        posts = self.write('posts.ndjson', '\n'.join([
+            '{"id": 100, "pub_date": "2015-03-01T10:00:00+00:00", '
+            '"author": "auth", "group": "old-group", "text": "Старый пост"}',
+            '{"id": 101, "pub_date": "2015-03-02T10:00:00+00:00", '
+            '"author": "newcomer", "group": "", "text": "Второй пост"}',
+        ]))
+        comments = self.write('comments.csv', (
+            'id,created,post,author,text\n'
+            '5,2015-03-03T10:00:00+00:00,100,newcomer,Комментарий\n'
+            '6,2015-03-03T11:00:00+00:00,999,auth,К чужому посту\n'
+        ))
+        output = StringIO()
+        call_command(
+            'import_posts', 'posts', posts, '--batch-size', '1',
+            stdout=output
+        )
+        call_command('import_posts', 'comments', comments, stdout=output)
+        self.assertIn('пропущено 1', output.getvalue())
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.group.slug, 'old-group')
+        self.assertEqual(post.group.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            Post.objects.get(pk=101).author.username, 'newcomer'
+        )
+        self.assertEqual(Comment.objects.get(pk=5).created.day, 3)
+        self.assertEqual(
+            User.objects.get(username='newcomer').stats.posts_count, 1
+        )
+        # Даты новых постов снова проставляются автоматически.
+        new_post = Post.objects.create(author=self.user, text='Новый')
+        self.assertGreater(new_post.pub_date.year, 2015)
+
+    def test_invalid_rows_are_skipped_and_counted(self):
+        Post.objects.create(id=7, author=self.user, text='Уже есть')
+        posts = self.write('posts.ndjson', '\n'.join([
+            '{"id": 100, "author": "auth", "text": "Хороший пост"}',
+            '{"id": 101, "author": "auth", "text": ""}',
+            '{"id": 100, "author": "auth", "text": "Повтор"}',
+            '{"id": 7, "author": "auth", "text": "Занятый id"}',
+            '{"id": "x", "author": "auth", "text": "Кривой id"}',
+            '{"id": 102, "author": "auth", "text": "Ещё пост"}',
+        ]))
+        output = StringIO()
+        call_command(
+            'import_posts', 'posts', posts, '--batch-size', '2',
+            stdout=output
+        )
+        self.assertIn('записано 2, пропущено 4', output.getvalue())
+        for reason in ('нет текста', 'повторный id', 'id уже занят',
+                       'неверное значение'):
+            self.assertIn(f'{reason}: 1', output.getvalue())
+        self.assertEqual(
+            set(Post.objects.values_list('pk', flat=True)), {7, 100, 102}
+        )
+        self.assertEqual(Post.objects.get(pk=100).text, 'Хороший пост')
+
+    def test_lines_that_are_not_objects_are_rejected(self):
+        posts = self.write('posts.ndjson', '\n'.join([
+            '{"id": 100, "author": "auth", "text": "Первый пост"}',
+            '[1, 2]',
+            '"строка"',
+            '{"id": 101, "author": "auth", "text": ',
+            '{"id": 102, "author": "auth", "text": "Второй пост"}',
+        ]))
+        output = StringIO()
+        call_command('import_posts', 'posts', posts, stdout=output)
+        self.assertIn('записано 2, пропущено 3', output.getvalue())
+        self.assertIn('не объект JSON: 3', output.getvalue())
+
+    def test_counters_are_fixed_when_import_fails(self):
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        path = os.path.join(self.directory, 'posts.ndjson')
+        with open(path, 'wb') as target:
+            # Первые пачки успевают записаться до неразборчивого байта.
+            for number in range(200):
+                target.write(
+                    f'{{"author": "auth", "text": "Пост {number}"}}\n'
+                    .encode()
+                )
+            target.write(b'\xff\n')
+        with self.assertRaises(UnicodeDecodeError):
+            call_command(
+                'import_posts', 'posts', path, '--batch-size', '10',
+                stdout=StringIO()
+            )
+        written = Post.objects.filter(author=self.user).count()
+        self.assertGreater(written, 0)
+        self.user.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, written)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=reader).count(), written
+        )
+
+    def test_import_rebuilds_timelines(self):
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        posts = self.write('posts.ndjson', (
+            '{"id": 100, "author": "auth", "text": "Старый пост"}'
+        ))
+        call_command('import_posts', 'posts', posts, stdout=StringIO())
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=reader, post_id=100).exists()
+        )
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class PostImageStorageTest(TransactionTestCase):
+    # Файлы удаляются после коммита, поэтому нужны настоящие транзакции.
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name=filename, content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def test_same_images_are_stored_once(self):
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$'
+        )
+        storage = first.image.storage
+        self.assertEqual(
+            storage.listdir(first.image.name.rsplit('/', 1)[0])[1],
+            [first.image.name.rsplit('/', 1)[1]]
+        )
+        self.assertTrue(
+            StoredImage.objects.filter(name=first.image.name).exists()
+        )
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_failed_upload_leaves_no_temporary_file(self):
+        upload = SimpleUploadedFile(
+            name='broken.gif', content=SMALL_GIF, content_type='image/gif'
+        )
+        upload.chunks = mock.Mock(side_effect=OSError)
+        storage = Post._meta.get_field('image').storage
+        with self.assertRaises(OSError):
+            storage.save('posts/broken.gif', upload)
+        directory = storage.path('posts')
+        self.assertFalse([
+            name for name in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, name))
+        ])
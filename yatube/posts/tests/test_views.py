@@ -1,10 +1,35 @@
+import csv
+import datetime
+import io
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+import warnings
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from core.testing import execute_on_commit
 
-from ..models import Group, Post, Comment
+from ..cache import bump_feed_generations, feed_generations
+from ..models import (AuthorStats, Comment, Follow, Group, PopularPost, Post,
+                      TimelineEntry)
+from ..paginators import CachedCountPaginator
+from ..thumbnails import POST_THUMBNAIL_WIDTHS, generate_thumbnails
 
 User = get_user_model()
 
@@ -185,15 +210,42 @@ class PostModelTest(TestCase):
 
     def test_cache(self):
         one = self.authorized_client.get(reverse('posts:index'))
-        post_1 = Post.objects.get(id=1)
-        post_1.text = 'new_text'
-        post_1.save()
+        Post.objects.filter(id=1).update(text='new_text')
         two = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(one.content, two.content)
         cache.clear()
         three = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(one.content, three.content)
 
+    def test_cache_is_invalidated_by_post_changes(self):
+        one = self.authorized_client.get(reverse('posts:index'))
+        post_1 = Post.objects.get(id=1)
+        post_1.text = 'new_text'
+        with execute_on_commit():
+            post_1.save()
+        two = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(one.content, two.content)
+        self.assertContains(two, 'new_text')
+        with execute_on_commit():
+            post_1.delete()
+        three = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(three, 'new_text')
+
+    def test_cache_is_separate_for_guests_and_users(self):
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.post.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for address in pages:
+            with self.subTest(address=address):
+                self.authorized_client.get(address)
+                response = self.guest_client.get(address)
+                self.assertNotContains(response, 'Выйти')
+                self.guest_client.get(address)
+                response = self.authorized_client.get(address)
+                self.assertContains(response, 'Выйти')
+
 
 class PaginatorViewsTest(TestCase):
 
@@ -251,3 +303,843 @@ class PaginatorViewsTest(TestCase):
         ]
         for response in responses:
             self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_cursor_pages(self):
+        first = self.client.get(reverse('posts:index'))
+        first_page = first.context['page_obj']
+        self.assertTrue(first_page.is_cursor)
+        self.assertFalse(first_page.has_previous())
+        self.assertContains(first, first_page.next_cursor)
+        second = self.client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}'
+        )
+        second_page = second.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        first_ids = {post.id for post in first_page}
+        second_ids = {post.id for post in second_page}
+        self.assertFalse(first_ids & second_ids)
+        back = self.client.get(
+            reverse('posts:index') + f'?cursor={second_page.previous_cursor}'
+        )
+        self.assertEqual(
+            [post.id for post in back.context['page_obj']],
+            [post.id for post in first_page]
+        )
+
+    def test_cursor_page_is_stable_after_new_post(self):
+        first_page = self.client.get(
+            reverse('posts:index')
+        ).context['page_obj']
+        Post.objects.create(text='Новый пост', author=self.user)
+        cache.clear()
+        second_page = self.client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+
+    def test_bad_cursor_and_deep_page_show_first_page(self):
+        for query in ('?cursor=broken', '?page=100000', '?page=abc'):
+            with self.subTest(query=query):
+                cache.clear()
+                response = self.client.get(reverse('posts:index') + query)
+                page_obj = response.context['page_obj']
+                self.assertTrue(page_obj.is_cursor)
+                self.assertEqual(len(page_obj), 10)
+
+    def test_page_count_is_cached_until_new_post(self):
+        address = reverse(
+            'posts:profile', kwargs={'username': 'auth'}
+        ) + '?page=2'
+        with self.assertNumQueries(4):
+            self.client.get(address)
+        with self.assertNumQueries(2):
+            response = self.client.get(address.replace('page=2', 'page=1'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        with execute_on_commit():
+            Post.objects.create(text='Новый пост', author=self.user)
+            Post.objects.create(
+                text='Ещё пост', author=User.objects.get(username='auth')
+            )
+        response = self.client.get(address)
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+
+    def test_elided_page_range(self):
+        paginator = CachedCountPaginator(
+            Post.objects.for_feed(), 1, 'elided-test'
+        )
+        self.assertEqual(
+            paginator.get_elided_page_range(7),
+            [1, '…', 5, 6, 7, 8, 9, '…', 13]
+        )
+        self.assertEqual(
+            paginator.get_elided_page_range(1),
+            [1, 2, 3, '…', 13]
+        )
+
+
+class FeedQueriesTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def create_posts(self, count):
+        Post.objects.bulk_create(
+            Post(
+                text=f'Тестовый текст {i}',
+                author=self.user,
+                group=self.group
+            ) for i in range(count)
+        )
+
+    def test_feed_query_count_does_not_depend_on_posts(self):
+        # С пустым кэшем: поиск ленты по slug/username, объект, посты.
+        pages_queries = {
+            reverse('posts:index'): 1,
+            reverse(
+                'posts:group_list',
+                kwargs={'slug': self.group.slug}
+            ): 3,
+            reverse(
+                'posts:profile',
+                kwargs={'username': self.user.username}
+            ): 3,
+        }
+        for posts_count in (10, 30):
+            self.create_posts(posts_count)
+            for address, queries in pages_queries.items():
+                with self.subTest(address=address, posts=posts_count):
+                    cache.clear()
+                    with self.assertNumQueries(queries):
+                        response = self.client.get(address)
+                    self.assertEqual(len(response.context['page_obj']), 10)
+                    self.assertContains(response, self.user.username)
+                    self.assertContains(response, self.group.slug)
+                    with self.assertNumQueries(0):
+                        self.client.get(address)
+
+
+class PostCardCacheTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.edited_post = Post.objects.create(
+            author=cls.user,
+            text='Пост для редактирования',
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user,
+            text='Другой пост',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_edit_invalidates_only_own_card(self):
+        self.client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.other_post.pk).update(text='Мимо кэша')
+        with execute_on_commit():
+            self.authorized_client.post(
+                reverse(
+                    'posts:post_edit',
+                    kwargs={'post_id': self.edited_post.pk}
+                ),
+                data={'text': 'Отредактированный пост'},
+            )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Отредактированный пост')
+        self.assertContains(response, 'Другой пост')
+        self.assertNotContains(response, 'Мимо кэша')
+
+
+class FeedGenerationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_generation_bumped_in_other_process_is_seen(self):
+        before = feed_generations(['index'])
+
+        def bump():
+            with execute_on_commit():
+                bump_feed_generations(['index'])
+
+        # Отдельный процесс, как другой воркер сервера.
+        worker = multiprocessing.get_context('fork').Process(target=bump)
+        worker.start()
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        self.assertNotEqual(feed_generations(['index']), before)
+
+    def test_generation_changes_after_commit(self):
+        user = User.objects.create_user(username='auth')
+        before = feed_generations(['index'])
+        with execute_on_commit():
+            Post.objects.create(author=user, text='Новый пост')
+            # До коммита новое поколение можно закэшировать вместе со
+            # старыми строками.
+            self.assertEqual(feed_generations(['index']), before)
+        self.assertNotEqual(feed_generations(['index']), before)
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_feed_returns_not_modified(self):
+        address = reverse('posts:index')
+        etag = self.client.get(address)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with execute_on_commit():
+            Post.objects.create(author=self.user, text='Новый пост')
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_etag_depends_on_visitor_and_page(self):
+        address = reverse('posts:index')
+        authorized_client = Client()
+        authorized_client.force_login(self.user)
+        etags = {
+            self.client.get(address)['ETag'],
+            self.client.get(address + '?page=2')['ETag'],
+            authorized_client.get(address)['ETag'],
+        }
+        self.assertEqual(len(etags), 3)
+
+    def test_post_detail_is_revalidated_by_comments(self):
+        address = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        response = self.client.get(address)
+        etag = response['ETag']
+        # Дата правки не учитывает число постов автора и шапку страницы.
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(
+            address, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)
+        )
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.user, text='Ещё')
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Ещё')
+
+
+class SearchTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.exact_post = Post.objects.create(
+            author=cls.user, text='Ёжик в тумане <b>ищет</b> лошадку'
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user, text='Пост про котов'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Ёжик номер {i}') for i in range(12)
+        )
+
+    def search(self, query, cursor=None):
+        params = {'q': query}
+        if cursor:
+            params['cursor'] = cursor
+        return self.client.get(reverse('posts:search'), params)
+
+    def test_search_highlights_and_escapes_matches(self):
+        response = self.search('лошад')
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), [self.exact_post])
+        self.assertContains(response, '<mark>лошадку</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_text_cannot_forge_match_markup(self):
+        text = 'Ёжик \x02<script>\x03 \ue000<b>\ue001 в кустах'
+        post = Post.objects.create(author=self.user, text=text)
+        post.refresh_from_db()
+        self.assertEqual(post.text, text)
+        response = self.search('кустах')
+        self.assertNotContains(response, '<mark>&lt;script&gt;</mark>')
+        self.assertNotContains(response, '<mark>&lt;b&gt;</mark>')
+        self.assertContains(response, '&lt;script&gt;')
+        self.assertContains(response, '<mark>кустах</mark>')
+
+    def test_search_is_paginated_by_cursor(self):
+        response = self.search('ЁЖИК')
+        first_page = list(response.context['page_obj'])
+        self.assertEqual(len(first_page), 10)
+        self.assertContains(response, '?q=%D0%81%D0%96%D0%98%D0%9A&cursor=')
+        cursor = response.context['page_obj'].next_cursor
+        second_page = list(self.search('ЁЖИК', cursor).context['page_obj'])
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(set(first_page) & set(second_page))
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(author=self.user, text='Про собак')
+        page_obj = self.search('собак').context['page_obj']
+        self.assertEqual(list(page_obj), [post])
+        Post.objects.filter(pk=post.pk).update(text='Про хомяков')
+        self.assertFalse(self.search('собак').context['page_obj'])
+        page_obj = self.search('хомяк').context['page_obj']
+        self.assertEqual(list(page_obj), [post])
+        post.delete()
+        self.assertFalse(self.search('хомяк').context['page_obj'])
+
+    def test_empty_query_shows_only_form(self):
+        response = self.search('')
+        self.assertIsNone(response.context['page_obj'])
+
+
+class FeedApiTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Иван', last_name='Петров'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(
+                author=cls.user,
+                group=cls.group if i % 2 else None,
+                text=f'Пост {i}',
+            ) for i in range(13)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_is_paginated_by_cursor(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('posts:api_index'))
+        data = response.json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertIsNone(data['previous'])
+        self.assertEqual(data['results'][0]['text'], 'Пост 12')
+        self.assertEqual(
+            data['results'][0]['author'],
+            {'username': 'auth', 'full_name': 'Иван Петров'}
+        )
+        data = self.client.get(data['next']).json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertIsNone(data['next'])
+
+    def test_sparse_fields(self):
+        response = self.client.get(
+            reverse('posts:api_group_posts', kwargs={'slug': 'test-slug'}),
+            {'fields': 'id,group'}
+        )
+        results = response.json()['results']
+        self.assertEqual(len(results), 6)
+        self.assertEqual(set(results[0]), {'id', 'group'})
+        self.assertEqual(results[0]['group']['slug'], 'test-slug')
+        response = self.client.get(
+            reverse('posts:api_index'), {'fields': 'id,password'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified_and_not_found(self):
+        address = reverse('posts:api_profile', kwargs={'username': 'auth'})
+        etag = self.client.get(address)['ETag']
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            reverse('posts:api_profile', kwargs={'username': 'nobody'})
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+
+    def test_old_names_stop_resolving_after_rename(self):
+        addresses = {
+            'old_group': reverse(
+                'posts:api_group_posts', kwargs={'slug': 'test-slug'}
+            ),
+            'new_group': reverse(
+                'posts:api_group_posts', kwargs={'slug': 'new-slug'}
+            ),
+            'old_profile': reverse(
+                'posts:api_profile', kwargs={'username': 'auth'}
+            ),
+            'new_profile': reverse(
+                'posts:api_profile', kwargs={'username': 'renamed'}
+            ),
+        }
+        self.client.get(addresses['old_group'])
+        self.client.get(addresses['old_profile'])
+        group = Group.objects.get(pk=self.group.pk)
+        user = User.objects.get(pk=self.user.pk)
+        with execute_on_commit():
+            group.slug = 'new-slug'
+            group.save()
+            user.username = 'renamed'
+            user.save()
+        for name, status in (('old_group', 404), ('new_group', 200),
+                             ('old_profile', 404), ('new_profile', 200)):
+            with self.subTest(address=name):
+                response = self.client.get(addresses[name])
+                self.assertEqual(response.status_code, status)
+
+
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group if i % 2 else None,
+                text=f'Пост {i}, "в кавычках"',
+            ) for i in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.staff, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def export(self, kind, **params):
+        response = self.staff_client.get(
+            reverse('posts:export', kwargs={'kind': kind}), params
+        )
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_is_staff_only(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(
+            reverse('posts:export', kwargs={'kind': 'posts'})
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_ndjson_export_with_filters(self):
+        lines = self.export('posts', group='test-slug').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            [self.posts[1].pk, self.posts[3].pk]
+        )
+        self.assertEqual(rows[0]['author'], 'auth')
+        self.assertEqual(rows[0]['group'], 'test-slug')
+        comments = self.export('comments').splitlines()
+        self.assertEqual(json.loads(comments[0])['author'], 'staff')
+        self.assertEqual(self.export('posts', since='2000-01-01',
+                                     until='2000-12-31'), '')
+
+    def test_csv_export_resumes_after_token(self):
+        rows = list(csv.reader(io.StringIO(self.export(
+            'posts', format='csv', after=self.posts[2].pk
+        ))))
+        self.assertEqual(
+            [int(row[0]) for row in rows],
+            [self.posts[3].pk, self.posts[4].pk]
+        )
+        self.assertEqual(rows[0][4], 'Пост 3, "в кавычках"')
+
+    def test_export_command_matches_view(self):
+        output = io.StringIO()
+        call_command('export_posts', 'posts', stdout=output,
+                     stderr=io.StringIO())
+        self.assertEqual(output.getvalue(), self.export('posts'))
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostThumbnailTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumbnail.gif',
+                content=(
+                    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                    b'\x0A\x00\x3B'
+                ),
+                content_type='image/gif'
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_placeholder_until_thumbnail_is_generated(self):
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertContains(response, 'Изображение обрабатывается')
+                self.assertNotContains(response, '<img class="card-img')
+        with execute_on_commit():
+            generate_thumbnails(self.post.image.name)
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertNotContains(response, 'Изображение обрабатывается')
+                self.assertContains(response, '<img class="card-img')
+                self.assertContains(response, 'type="image/webp"')
+                for width in POST_THUMBNAIL_WIDTHS:
+                    self.assertContains(response, f'.webp {width}w', 1)
+                    self.assertContains(response, f'.jpg {width}w', 1)
+
+
+class GroupFeedTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(
+                text=f'Пост группы {i}',
+                author=cls.user,
+                group=cls.group
+            ) for i in range(3)
+        )
+        Post.objects.bulk_create(
+            Post(
+                text=f'Пост другой группы {i}',
+                author=cls.user,
+                group=cls.other_group
+            ) for i in range(12)
+        )
+        Post.objects.create(text='Пост без группы', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def get_group_page(self, group, query=''):
+        return self.client.get(
+            reverse('posts:group_list', kwargs={'slug': group.slug}) + query
+        )
+
+    def test_group_feed_contains_only_group_posts(self):
+        for query in ('', '?page=1'):
+            with self.subTest(query=query):
+                cache.clear()
+                page_obj = self.get_group_page(
+                    self.group, query
+                ).context['page_obj']
+                self.assertEqual(len(page_obj), 3)
+                self.assertEqual(
+                    {post.group_id for post in page_obj}, {self.group.pk}
+                )
+        self.assertEqual(page_obj.paginator.count, 3)
+
+    def test_group_feed_queries_are_scoped_to_group(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_group_page(self.group, '?page=1')
+        post_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "posts_post"' in query['sql']
+        ]
+        self.assertEqual(len(post_queries), 2)
+        for sql in post_queries:
+            self.assertIn(f'"posts_post"."group_id" = {self.group.pk}', sql)
+
+    def test_post_moved_between_groups(self):
+        self.get_group_page(self.group, '?page=1')
+        self.get_group_page(self.other_group, '?page=1')
+        post = self.group.posts.first()
+        with execute_on_commit():
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={'text': post.text, 'group': self.other_group.pk},
+            )
+        old_page = self.get_group_page(
+            self.group, '?page=1'
+        ).context['page_obj']
+        new_page = self.get_group_page(
+            self.other_group, '?page=1'
+        ).context['page_obj']
+        self.assertNotIn(post, old_page)
+        self.assertEqual(old_page.paginator.count, 2)
+        self.assertEqual(new_page.paginator.count, 13)
+
+
+class CommentsPageTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        Comment.objects.bulk_create(
+            Comment(
+                post=cls.post,
+                author=User.objects.create_user(username=f'user{i}'),
+                text=f'Комментарий {i}'
+            ) for i in range(25)
+        )
+
+    def get_detail(self, query=''):
+        return self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+            + query
+        )
+
+    def test_comments_are_paginated_with_authors_joined(self):
+        # Первый запрос считает ETag страницы.
+        with self.assertNumQueries(3):
+            response = self.get_detail()
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'Комментарий 0')
+        self.assertNotContains(response, 'Комментарий 24')
+        self.assertContains(response, 'Показать ещё')
+
+    def test_load_more_fragment(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            first = self.get_detail().context['comments']
+            response = self.client.get(
+                reverse(
+                    'posts:post_comments', kwargs={'post_id': self.post.id}
+                ) + f'?cursor={first.next_cursor}'
+            )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertContains(response, 'Комментарий 24')
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_comments_limit_is_capped(self):
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text='Ещё')
+            for _ in range(100)
+        )
+        for limit, expected in (('5', 5), ('1000', 100), ('abc', 20)):
+            with self.subTest(limit=limit):
+                response = self.get_detail(f'?limit={limit}')
+                self.assertEqual(len(response.context['comments']), expected)
+
+
+class FollowTest(TransactionTestCase):
+    # Посты раскладываются по лентам после коммита.
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.client.force_login(self.reader)
+
+    def follow(self, author):
+        return self.client.get(
+            reverse('posts:profile_follow', args=[author.username])
+        )
+
+    def feed(self, cursor=None):
+        response = self.client.get(
+            reverse('posts:follow_index'), {'cursor': cursor or ''}
+        )
+        return response.context['page_obj']
+
+    def test_follow_backfills_and_new_posts_are_fanned_out(self):
+        old = Post.objects.create(author=self.author, text='Старый пост')
+        response = self.follow(self.author)
+        self.assertRedirects(
+            response, reverse('posts:profile', args=['author'])
+        )
+        self.assertEqual(self.author.stats.followers_count, 1)
+        new = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True
+            ).order_by('pk')),
+            [old.pk, new.pk]
+        )
+        self.assertEqual(list(self.feed()), [new, old])
+        profile = self.client.get(
+            reverse('posts:profile', args=['author'])
+        )
+        self.assertContains(profile, 'Отписаться')
+        self.client.get(
+            reverse('posts:profile_unfollow', args=['author'])
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists()
+        )
+        self.assertEqual(list(self.feed()), [])
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).followers_count, 0
+        )
+        self.follow(self.author)
+        self.author.delete()
+        self.assertFalse(Follow.objects.exists())
+
+    def test_users_cannot_follow_themselves(self):
+        self.follow(self.reader)
+        self.assertFalse(Follow.objects.exists())
+
+    @override_settings(FOLLOW_FANOUT_LIMIT=1)
+    def test_popular_authors_are_merged_on_read(self):
+        regular = User.objects.create_user(username='regular')
+        self.follow(regular)
+        self.follow(self.author)
+        Follow.objects.create(
+            user=User.objects.create_user(username='fan'), author=self.author
+        )
+        posts = [
+            Post.objects.create(
+                author=self.author if number % 2 else regular,
+                text=f'Пост {number}'
+            ) for number in range(12)
+        ]
+        # Раскладываются только посты автора с одним подписчиком.
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 6
+        )
+        first = self.feed()
+        self.assertEqual(list(first), posts[::-1][:10])
+        second = self.feed(first.next_cursor)
+        self.assertEqual(list(second), posts[1::-1])
+        self.assertEqual(list(self.feed(second.previous_cursor)), list(first))
+
+    def test_rebuild_command_restores_timelines(self):
+        self.follow(self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        TimelineEntry.objects.all().delete()
+        output = io.StringIO()
+        call_command('rebuild_timelines', stdout=output)
+        self.assertIn('лент: 1, строк: 1', output.getvalue())
+        self.assertEqual(list(self.feed()), [post])
+
+
+class PopularFeedTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+
+    def comment(self, post, count, days_ago=0):
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.author, text='Комментарий')
+            for _ in range(count)
+        )
+        Comment.objects.filter(post=post).update(
+            created=timezone.now() - datetime.timedelta(days=days_ago)
+        )
+
+    def rank(self):
+        output = io.StringIO()
+        call_command('rank_popular_posts', stdout=output)
+        return output.getvalue()
+
+    def feed(self, cursor=None):
+        response = self.client.get(
+            reverse('posts:popular'), {'cursor': cursor or ''}
+        )
+        return response.context['page_obj']
+
+    def test_recent_activity_outranks_older_activity(self):
+        older, recent, stale, quiet = [
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+            for number in range(4)
+        ]
+        self.comment(older, 3, days_ago=2)
+        self.comment(recent, 2)
+        self.comment(stale, 10, days_ago=10)
+        self.assertIn('Постов в популярной ленте: 2', self.rank())
+        self.assertEqual(list(self.feed()), [recent, older])
+        self.assertGreater(
+            PopularPost.objects.get(post=recent).score,
+            PopularPost.objects.get(post=older).score
+        )
+        # Удаление поста сбрасывает закэшированные страницы ленты.
+        with execute_on_commit():
+            recent.delete()
+        self.assertEqual(list(self.feed()), [older])
+
+    def test_feed_is_paginated_by_score(self):
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+            for number in range(12)
+        ]
+        for number, post in enumerate(posts):
+            self.comment(post, number + 1)
+        self.rank()
+        first = self.feed()
+        self.assertEqual(list(first), posts[::-1][:10])
+        self.assertFalse(first.has_previous())
+        second = self.feed(first.next_cursor)
+        self.assertEqual(list(second), posts[1::-1])
+        self.assertFalse(second.has_next())
+        self.assertEqual(list(self.feed(second.previous_cursor)), list(first))
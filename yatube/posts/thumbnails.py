@@ -0,0 +1,168 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile
+
+from core.instrumentation import timed
+
+from .cache import bump_feed_generations, feeds_for
+from .models import Post, StoredImage
+
+logger = logging.getLogger(__name__)
+
+# Миниатюры картинки поста: несколько ширин с одинаковыми пропорциями
+# в WebP и в JPEG для браузеров без его поддержки.
+POST_THUMBNAIL_RATIO = 339 / 960
+POST_THUMBNAIL_WIDTHS = (480, 960, 1440)
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+POST_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+# Ширина и формат, которые попадают в src для старых браузеров.
+FALLBACK_WIDTH = 960
+FALLBACK_FORMAT = 'JPEG'
+# Сколько секунд повторная постановка той же картинки в очередь
+# считается лишней.
+PENDING_TIMEOUT = 10 * 60
+
+_executor = None
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Возвращает готовую миниатюру или ``None``, не создавая её.
+
+        Имя миниатюры вычисляется так же, как в ``get_thumbnail``,
+        поэтому обе функции находят одну и ту же запись хранилища.
+        """
+        source = ImageFile(file_)
+        if settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def post_thumbnail_geometry(width):
+    return f'{width}x{round(width * POST_THUMBNAIL_RATIO)}'
+
+
+def post_thumbnail_variants():
+    for format_ in POST_THUMBNAIL_FORMATS:
+        for width in POST_THUMBNAIL_WIDTHS:
+            yield format_, width
+
+
+def post_image_file(image):
+    # Хранилище входит в ключ миниатюры, поэтому и по имени картинки,
+    # и по полю модели миниатюры ищутся с хранилищем поля.
+    return ImageFile(
+        getattr(image, 'name', image), Post._meta.get_field('image').storage
+    )
+
+
+def cached_post_thumbnails(image):
+    """Готовые миниатюры картинки: ``{(формат, ширина): миниатюра}``."""
+    if not image:
+        return {}
+    image = post_image_file(image)
+    thumbnails = {}
+    with timed('thumbnails'):
+        for format_, width in post_thumbnail_variants():
+            thumbnail = default.backend.get_cached_thumbnail(
+                image, post_thumbnail_geometry(width),
+                format=format_, **POST_THUMBNAIL_OPTIONS
+            )
+            if thumbnail is not None:
+                thumbnails[format_, width] = thumbnail
+    return thumbnails
+
+
+def pending_key(name):
+    return f'thumbnail_pending:{name}'
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=django_settings.POST_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def _submit(name):
+    if not django_settings.POST_THUMBNAIL_WORKERS:
+        generate_thumbnails(name)
+    elif cache.add(pending_key(name), True, PENDING_TIMEOUT):
+        _get_executor().submit(_work, name)
+
+
+def schedule_thumbnails(name):
+    """Ставит создание миниатюр картинки в очередь после коммита."""
+    if name:
+        transaction.on_commit(lambda: _submit(name))
+
+
+def generate_thumbnails(name):
+    """Создаёт миниатюры картинки и обновляет карточки её постов."""
+    image = post_image_file(name)
+    with timed('thumbnails'):
+        for format_, width in post_thumbnail_variants():
+            get_thumbnail(
+                image, post_thumbnail_geometry(width),
+                format=format_, **POST_THUMBNAIL_OPTIONS
+            )
+    posts = Post.objects.filter(image=name)
+    feeds = set()
+    for author_id, group_id in posts.values_list('author_id', 'group_id'):
+        feeds.update(feeds_for(author_id, group_id))
+    # Закэшированные карточки и страницы содержат заглушку.
+    posts.update(updated=timezone.now())
+    bump_feed_generations(feeds)
+
+
+def _work(name):
+    # Рабочий поток сам закрывает свои соединения с базой
+    # и пишет ошибки в лог: наружу их никто не получит.
+    try:
+        generate_thumbnails(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+    finally:
+        cache.delete(pending_key(name))
+        connections.close_all()
+
+
+def _delete_unused(name):
+    # Та же блокировка, что при сохранении: новый пост с этой картинкой
+    # либо уже закоммичен, либо запишет файл заново.
+    with transaction.atomic():
+        StoredImage.lock(name)
+        if Post.objects.filter(image=name).exists():
+            return
+        StoredImage.objects.filter(name=name).delete()
+        delete(post_image_file(name))
+
+
+def release_image(name):
+    """Удаляет картинку и её миниатюры, если она больше не используется.
+
+    Одинаковые загрузки хранятся одним файлом, поэтому ссылки на него
+    считаются по постам после коммита, а не при удалении одного поста.
+    """
+    if name:
+        transaction.on_commit(lambda: _delete_unused(name))
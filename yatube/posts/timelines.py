@@ -0,0 +1,158 @@
+"""Ленты подписок: раскладка при записи и сборка при чтении.
+
+Новый пост автора сразу раскладывается по лентам его подписчиков
+(``TimelineEntry``) пачками после коммита. Посты авторов, у которых
+подписчиков больше ``FOLLOW_FANOUT_LIMIT``, не раскладываются: их
+лента читателя добирает при чтении из индекса постов автора.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginators import CursorPaginator
+
+FANOUT_BATCH_SIZE = 1000
+# Сколько последних постов автора попадает в ленту при подписке.
+TIMELINE_BACKFILL = 100
+
+
+def is_popular(followers_count):
+    return followers_count > settings.FOLLOW_FANOUT_LIMIT
+
+
+def popular_author_ids(user_id):
+    """Авторы, на которых подписан читатель и чьи посты не раскладываются."""
+    return list(Follow.objects.filter(
+        user_id=user_id,
+        author__stats__followers_count__gt=settings.FOLLOW_FANOUT_LIMIT
+    ).values_list('author_id', flat=True))
+
+
+def _entries(user_ids, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id in user_ids
+        for post_id, pub_date in posts
+    ]
+
+
+def fan_out(author_id, posts, batch_size=FANOUT_BATCH_SIZE):
+    """Раскладывает посты ``[(id, pub_date)]`` по лентам подписчиков.
+
+    Подписчики читаются порциями по id подписки, каждая порция
+    вставляется своей транзакцией.
+    """
+    follows = Follow.objects.filter(author_id=author_id).order_by('pk')
+    last_id = 0
+    while True:
+        chunk = list(follows.filter(pk__gt=last_id).values_list(
+            'pk', 'user_id'
+        )[:batch_size])
+        if not chunk:
+            return
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                _entries([user_id for _, user_id in chunk], posts),
+                batch_size=batch_size, ignore_conflicts=True
+            )
+        last_id = chunk[-1][0]
+
+
+def recent_posts(author_id, limit=TIMELINE_BACKFILL):
+    return list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('pk', 'pub_date')[:limit])
+
+
+def post_published(post):
+    """Раскладывает новый пост после коммита, если автор не популярен."""
+    followers_count = AuthorStats.objects.filter(
+        author_id=post.author_id
+    ).values_list('followers_count', flat=True).first()
+    if not followers_count or is_popular(followers_count):
+        return
+    posts = [(post.pk, post.pub_date)]
+    transaction.on_commit(lambda: fan_out(post.author_id, posts))
+
+
+def followed(user_id, author_id, followers_count):
+    if not is_popular(followers_count):
+        TimelineEntry.objects.bulk_create(
+            _entries([user_id], recent_posts(author_id)),
+            ignore_conflicts=True
+        )
+
+
+def unfollowed(user_id, author_id, followers_count):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+    if followers_count == settings.FOLLOW_FANOUT_LIMIT:
+        # Автор перестал быть популярным: его свежие посты, которые
+        # раньше добирались при чтении, раскладываем по лентам.
+        posts = recent_posts(author_id)
+        transaction.on_commit(lambda: fan_out(author_id, posts))
+
+
+def rebuild_timeline(user_id, batch_size=FANOUT_BATCH_SIZE):
+    """Собирает ленту читателя заново, возвращает число строк."""
+    authors = Follow.objects.filter(user_id=user_id).exclude(
+        author__stats__followers_count__gt=settings.FOLLOW_FANOUT_LIMIT
+    ).values_list('author_id', flat=True)
+    posts = Post.objects.filter(author_id__in=authors).order_by(
+        'pk'
+    ).values_list('pk', 'pub_date')
+    written = 0
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        last_id = 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_id)[:batch_size])
+            if not chunk:
+                break
+            TimelineEntry.objects.bulk_create(
+                _entries([user_id], chunk), batch_size=batch_size
+            )
+            written += len(chunk)
+            last_id = chunk[-1][0]
+    return written
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорная лента подписок в порядке (-pub_date, -id).
+
+    Страница собирается из двух выборок по индексам — разложенной
+    ленты и постов популярных авторов — и сливается в памяти.
+    """
+
+    def __init__(self, user_id, per_page):
+        super().__init__(Post.objects.for_feed(), per_page)
+        self.user_id = user_id
+        self.popular = popular_author_ids(user_id)
+
+    def fetch(self, values, forward, limit):
+        entries = TimelineEntry.objects.filter(user_id=self.user_id)
+        if values is not None:
+            entries = entries.filter(self.keyset_filter(
+                values, forward, fields=('pub_date', 'post_id')
+            ))
+        ordering = ('-pub_date', '-post_id') if forward else (
+            'pub_date', 'post_id'
+        )
+        post_ids = list(entries.order_by(*ordering).values_list(
+            'post_id', flat=True
+        )[:limit])
+        posts = {post.pk: post for post in self.object_list.filter(
+            pk__in=post_ids
+        )}
+        if self.popular:
+            posts.update(
+                (post.pk, post) for post in CursorPaginator(
+                    self.object_list.filter(author_id__in=self.popular),
+                    self.per_page
+                ).fetch(values, forward, limit)
+            )
+        return sorted(
+            posts.values(), key=lambda post: (post.pub_date, post.pk),
+            reverse=forward
+        )[:limit]
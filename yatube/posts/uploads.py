@@ -0,0 +1,187 @@
+import io
+import shutil
+from functools import wraps
+
+from django import forms
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40 * 1000 * 1000
+# Размеры картинки обычно записаны в первых килобайтах файла. Если
+# заголовок не уместился, они проверяются по целому файлу.
+HEADER_SIZE = 64 * 1024
+EXIF_ORIENTATION = 0x0112
+
+SIZE_ERROR = 'Файл больше {} МБ.'.format(MAX_IMAGE_SIZE // (1024 * 1024))
+PIXELS_ERROR = 'Картинка больше {} мегапикселей.'.format(
+    MAX_IMAGE_PIXELS // (1000 * 1000)
+)
+BROKEN_JPEG_ERROR = 'Файл JPEG повреждён.'
+
+
+class RejectedUploadedFile(UploadedFile):
+    """Пустой файл на месте отклонённой загрузки с причиной отказа."""
+
+    def __init__(self, name, content_type, error):
+        super().__init__(io.BytesIO(), name, content_type, 0)
+        self.upload_error = error
+
+
+class BoundedImageField(forms.ImageField):
+
+    def to_python(self, data):
+        error = getattr(data, 'upload_error', None)
+        if error is not None:
+            raise forms.ValidationError(error, code='invalid_image')
+        return super().to_python(data)
+
+
+def too_many_pixels(image_file):
+    """Проверяет размеры картинки по заголовку, не декодируя её.
+
+    Возвращает ``None``, если файл не похож на картинку: такую
+    загрузку отклонит проверка поля формы.
+    """
+    try:
+        with Image.open(image_file) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        return True
+    except Exception:
+        return None
+    return width * height > MAX_IMAGE_PIXELS
+
+
+def strip_jpeg_metadata(source, target):
+    """Копирует JPEG без сегментов APP1 (EXIF и XMP), не декодируя его."""
+    target.write(source.read(2))
+    while True:
+        marker = source.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF or marker[1] == 0xDA:
+            # Дальше идут сжатые данные: копируем их как есть.
+            target.write(marker)
+            shutil.copyfileobj(source, target)
+            return
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+            target.write(marker)
+            continue
+        length = source.read(2)
+        # Длина сегмента включает сами два байта длины.
+        size = int.from_bytes(length, 'big') - 2
+        if len(length) < 2 or size < 0:
+            raise forms.ValidationError(
+                BROKEN_JPEG_ERROR, code='invalid_image'
+            )
+        payload = source.read(size)
+        if marker[1] != 0xE1:
+            target.write(marker + length + payload)
+
+
+class BoundedImageUploadHandler(TemporaryFileUploadHandler):
+    """Принимает картинки потоком на диск с ограничением размера.
+
+    Размер файла проверяется по мере получения, размеры в пикселях —
+    по заголовку, так что слишком большие файлы и «бомбы» отклоняются
+    до декодирования. У принятых JPEG удаляются EXIF и XMP, а
+    повёрнутые через EXIF картинки поворачиваются по-настоящему.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.received = 0
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error is not None:
+            return None
+        self.received += len(raw_data)
+        if self.received > MAX_IMAGE_SIZE:
+            self.error = SIZE_ERROR
+            return None
+        if self.header is not None:
+            self.header += raw_data
+            if len(self.header) >= HEADER_SIZE:
+                if too_many_pixels(io.BytesIO(self.header)):
+                    self.error = PIXELS_ERROR
+                    return None
+                self.header = None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        if self.error is None and too_many_pixels(upload):
+            self.error = PIXELS_ERROR
+        if self.error is not None:
+            upload.close()
+            return RejectedUploadedFile(
+                self.file_name, self.content_type, self.error
+            )
+        upload.seek(0)
+        return self.normalize(upload)
+
+    def normalize(self, upload):
+        try:
+            with Image.open(upload) as image:
+                if image.format != 'JPEG':
+                    return upload
+                orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+                if orientation != 1:
+                    # Поворот без декодирования невозможен: пересохраняем.
+                    image = ImageOps.exif_transpose(image)
+                    return self.replace(
+                        upload, lambda target: image.save(
+                            target, 'JPEG', quality=90
+                        )
+                    )
+                if 'exif' not in image.info and 'xmp' not in image.info:
+                    return upload
+        except Exception:
+            upload.seek(0)
+            return upload
+        upload.seek(0)
+        try:
+            return self.replace(
+                upload, lambda target: strip_jpeg_metadata(upload, target)
+            )
+        except forms.ValidationError as error:
+            return RejectedUploadedFile(
+                self.file_name, self.content_type, error.messages[0]
+            )
+
+    def replace(self, upload, write):
+        normalized = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra
+        )
+        try:
+            write(normalized)
+        except Exception:
+            normalized.close()
+            raise
+        finally:
+            upload.close()
+        normalized.size = normalized.tell()
+        normalized.seek(0)
+        return normalized
+
+
+def bounded_image_uploads(view):
+    """Принимает файлы запросов к view через BoundedImageUploadHandler.
+
+    Остальные страницы сайта работают со стандартными обработчиками.
+    Обработчики можно сменить только до чтения request.POST, а его
+    читает CsrfViewMiddleware, поэтому проверка CSRF переносится сюда.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [BoundedImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
@@ -1,34 +1,56 @@
+from urllib.parse import urlencode
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
-
-from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Comment
+from django.views.decorators.http import condition
+
+from .cache import (cache_feed, group_feed, index_feed, popular_feed,
+                    post_etag, profile_feed, revalidate)
+from .export import EXPORTS, FORMATS, export_rows
+from .forms import CommentForm, ExportForm, PostForm
+from .models import Comment, Follow, Group, Post, User
+from .paginators import CursorPaginator, paginate
+from .popular import PopularPaginator
+from .search import SearchPaginator, is_supported as search_is_supported
+from .timelines import TimelinePaginator
+from .uploads import bounded_image_uploads
 
 POSTS_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+# Больше комментариев за один ответ не отдаём, даже если просят ?limit=.
+MAX_COMMENTS_ON_PAGE = 100
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_feed(index_feed)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(post_list, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    page_obj = paginate(request, post_list, POSTS_ON_PAGE, 'index')
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@cache_feed(popular_feed)
+def popular(request):
+    template = 'posts/popular.html'
+    page_obj = PopularPaginator(POSTS_ON_PAGE).get_page(
+        request.GET.get('cursor')
+    )
+    return render(request, template, {'page_obj': page_obj})
+
+
+@cache_feed(group_feed)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.all().order_by('-pub_date')
-    paginator = Paginator(post_list, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = group.posts.for_feed()
+    page_obj = paginate(
+        request, post_list, POSTS_ON_PAGE, f'group:{group.pk}'
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -36,33 +58,88 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@cache_feed(profile_feed)
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author).order_by('-pub_date')
-    paginator = Paginator(post_list, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    post_list = Post.objects.for_feed().filter(author=author)
+    page_obj = paginate(
+        request, post_list, POSTS_ON_PAGE, f'profile:{author.pk}'
+    )
+    following = (
+        request.user.is_authenticated
+        and Follow.objects.filter(user=request.user, author=author).exists()
+    )
     context = {
         'author': author,
         'page_obj': page_obj,
+        'following': following,
+    }
+    return render(request, template, context)
+
+
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        if search_is_supported():
+            paginator = SearchPaginator(query, POSTS_ON_PAGE)
+        else:
+            paginator = CursorPaginator(
+                Post.objects.for_feed().filter(text__icontains=query),
+                POSTS_ON_PAGE
+            )
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'extra_query': urlencode({'q': query}),
     }
     return render(request, template, context)
 
 
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
-    comment = Comment.objects.filter(post=post)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
-        'comment': comment,
+        'comments': get_comments_page(request, post),
         'form': form,
     }
+    return revalidate(render(request, template, context))
+
+
+def get_comments_page(request, post):
+    comments = Comment.objects.filter(post=post).select_related(
+        'author'
+    ).only('text', 'created', 'author__username')
+    try:
+        limit = int(request.GET.get('limit', COMMENTS_ON_PAGE))
+    except ValueError:
+        limit = COMMENTS_ON_PAGE
+    limit = min(max(limit, 1), MAX_COMMENTS_ON_PAGE)
+    paginator = CursorPaginator(comments, limit, ordering=('created', 'id'))
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def post_comments(request, post_id):
+    template = 'posts/includes/comments.html'
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page(request, post),
+    }
     return render(request, template, context)
 
 
+@bounded_image_uploads
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -81,6 +158,7 @@ def post_create(request):
     return render(request, template, {'form': form})
 
 
+@bounded_image_uploads
 @login_required
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
@@ -104,6 +182,32 @@ def post_edit(request, post_id):
         return render(request, template, context)
 
 
+@login_required
+def follow_index(request):
+    template = 'posts/follow.html'
+    page_obj = TimelinePaginator(request.user.pk, POSTS_ON_PAGE).get_page(
+        request.GET.get('cursor')
+    )
+    return render(request, template, {'page_obj': page_obj})
+
+
+@login_required
+def profile_follow(request, username):
+    author = get_object_or_404(User, username=username)
+    if author != request.user:
+        Follow.objects.get_or_create(user=request.user, author=author)
+    return redirect('posts:profile', username)
+
+
+@login_required
+def profile_unfollow(request, username):
+    author = get_object_or_404(User, username=username)
+    # Через экземпляры, чтобы сработали сигналы.
+    for follow in Follow.objects.filter(user=request.user, author=author):
+        follow.delete()
+    return redirect('posts:profile', username)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -114,3 +218,32 @@ def add_comment(request, post_id):
         comment.post = post
         comment.save()
     return redirect('posts:post_detail', post_id)
+
+
+@staff_member_required
+def export(request, kind):
+    if kind not in EXPORTS:
+        raise Http404
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse(form.errors, status=400)
+    filters = form.cleaned_data
+    format_ = filters.pop('format') or 'ndjson'
+    after = filters.pop('after') or 0
+    lines, content_type = FORMATS[format_]
+    # Строки формируются по мере отправки ответа, порциями из базы.
+    response = StreamingHttpResponse(
+        lines(
+            EXPORTS[kind].names,
+            export_rows(
+                kind, after=after,
+                **{name: value or None for name, value in filters.items()}
+            ),
+            header=not after
+        ),
+        content_type=f'{content_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{format_}"'
+    )
+    return response
@@ -50,11 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,7 +65,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -133,6 +134,14 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# Сессии читаются из кэша SESSION_CACHE_ALIAS, база — запасное
+# хранилище на случай вытеснения. Пользователь запроса берётся из того
+# же кэша, см. core.auth. Кэш должен быть общим для всех воркеров,
+# иначе выход и смена пароля не дойдут до остальных процессов.
+# Просроченные сессии удаляет команда clear_expired_sessions.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -142,9 +151,68 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Поколения и счётчики лент, id групп и авторов по имени и страницы
+# лент (L2 кэша pages) должны быть общими для всех воркеров, иначе
+# изменение, сделанное в одном процессе, не дойдёт до остальных. Их
+# хранит файл SQLite, см. core.cache.SQLiteCache. Файлы кэшей лежат
+# вне исходников; тесты переносят их во временный каталог, см.
+# core.testing.
+CACHE_DIR = os.path.join(os.path.dirname(BASE_DIR), 'var', 'cache')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.InstrumentedSQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Страницы лент и фрагменты шаблонов: L1 процесса перед default
+    # с защитой от одновременного пересчёта, см. core.cache.TieredCache.
+    'pages': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {'MAX_ENTRIES': 500, 'L1_TIMEOUT': 5},
+    },
+    'sessions': {
+        'BACKEND': 'core.cache.InstrumentedSQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'sessions.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.ThumbnailBackend'
+# Доля запросов, для которых ищутся повторяющиеся SQL-запросы; из них
+# те, что дольше REQUEST_TIMING_SLOW_MS, пишутся в SLOW_REQUEST_LOG.
+REQUEST_TIMING_SAMPLE_RATE = 0.0
+REQUEST_TIMING_SLOW_MS = 500
+SLOW_REQUEST_LOG = os.path.join(BASE_DIR, 'slow_requests.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_REQUEST_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            # Файл создаётся при первой записи.
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'yatube.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
+# Потоки, в которых создаются миниатюры; 0 — создавать сразу после коммита.
+POST_THUMBNAIL_WORKERS = 2
+
+# Посты авторов, у которых подписчиков больше, не раскладываются по
+# лентам подписок, а добираются при чтении (см. posts.timelines).
+FOLLOW_FANOUT_LIMIT = 1000